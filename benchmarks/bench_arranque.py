@@ -0,0 +1,82 @@
+# bench_arranque.py
+# Mide cuánto tarda en arrancar cada subcomando de main.py: tiempo total del proceso, tiempo
+# de importación (python -X importtime) y si terminó importando pandas. Como piso se mide
+# importar solo peewee, y como referencia importar gestionar_obras.
+#
+#   python benchmarks/bench_arranque.py                  # 10 repeticiones por comando
+#   python benchmarks/bench_arranque.py --repeticiones 30 --mostrar-modulos 15
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(DIRECTORIO)
+MAIN = os.path.join(RAIZ, 'main.py')
+
+# nombre -> argumentos de python; los de main.py corren contra una base ya cargada
+COMANDOS = {
+    'import peewee (piso)': ['-c', 'import peewee'],
+    'import gestionar_obras': ['-c', 'import gestionar_obras'],
+    'indicadores': [MAIN, '--nivel', 'silencio', 'indicadores'],
+    'buscar texto': [MAIN, '--nivel', 'silencio', 'buscar', 'escuela'],
+    'buscar cercanas': [MAIN, '--nivel', 'silencio', 'buscar', '--cerca', '-34.60', '-58.38'],
+}
+
+
+def medir(argumentos, repeticiones, directorio):
+    """
+    Corre python con argumentos en directorio y devuelve (mejor tiempo total en segundos,
+    importaciones), donde importaciones es una lista de (módulo, microsegundos acumulados) de
+    la última corrida con -X importtime.
+    """
+    entorno = {**os.environ, 'PYTHONPATH': RAIZ}
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable] + argumentos, cwd=directorio, env=entorno, check=True,
+                       stdout=subprocess.DEVNULL)
+        tiempos.append(time.perf_counter() - inicio)
+    proceso = subprocess.run([sys.executable, '-X', 'importtime'] + argumentos, cwd=directorio, env=entorno,
+                             check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return min(tiempos), _importaciones(proceso.stderr)
+
+
+def _importaciones(salida):
+    # Líneas "import time: propio | acumulado | módulo"; la sangría del nombre marca el anidamiento
+    importaciones = []
+    for linea in salida.splitlines():
+        if not linea.startswith('import time:') or 'cumulative' in linea:
+            continue
+        _, acumulado, modulo = linea[len('import time:'):].split('|')
+        importaciones.append((modulo.rstrip(), int(acumulado)))
+    return importaciones
+
+
+def _total_importacion(importaciones):
+    # Suma de los módulos de primer nivel (sin sangría extra): el resto está incluido en ellos
+    return sum(acumulado for modulo, acumulado in importaciones if modulo.startswith(' ') and modulo[1] != ' ')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Tiempo de arranque de los subcomandos de main.py.")
+    parser.add_argument('--repeticiones', type=int, default=10)
+    parser.add_argument('--mostrar-modulos', type=int, default=0, metavar='N',
+                        help="muestra los N módulos que más tardan en importarse por comando")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporal:
+        # Base con el CSV de ejemplo, cargada una sola vez
+        subprocess.run([sys.executable, MAIN, '--nivel', 'silencio', 'cargar',
+                        '--csv', os.path.join(RAIZ, 'observatorio-de-obras-urbanas.csv')],
+                       cwd=temporal, check=True)
+        print(f"{'comando':<24}{'total':>10}{'imports':>10}  pandas")
+        for nombre, argumentos in COMANDOS.items():
+            segundos, importaciones = medir(argumentos, args.repeticiones, temporal)
+            con_pandas = any(modulo.strip() == 'pandas' for modulo, _ in importaciones)
+            print(f"{nombre:<24}{segundos * 1000:>8.0f}ms{_total_importacion(importaciones) / 1000:>8.0f}ms"
+                  f"  {'sí' if con_pandas else 'no'}")
+            for modulo, acumulado in sorted(importaciones, key=lambda par: -par[1])[:args.mostrar_modulos]:
+                print(f"    {modulo.strip():<40}{acumulado / 1000:>8.1f}ms")
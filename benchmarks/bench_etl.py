@@ -0,0 +1,284 @@
+# bench_etl.py
+# Mide por separado cada etapa del ETL (extraer, limpiar, cargar, indicadores) sobre datasets
+# sintéticos de distintos tamaños y deja los resultados en JSON para comparar corridas.
+#
+#   python benchmarks/bench_etl.py                       # 10k, 100k y 1M filas
+#   python benchmarks/bench_etl.py --tamanos 10000       # solo 10k
+#   python benchmarks/bench_etl.py --comparar benchmarks/resultados/base.json
+#   python benchmarks/bench_etl.py --procesos 4       # agrega la ingesta en paralelo con 4 procesos
+import argparse
+import contextlib
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(DIRECTORIO)
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, DIRECTORIO)
+
+TAMANOS = [10_000, 100_000, 1_000_000]
+# por debajo de este tiempo las diferencias son ruido y no se reportan como regresión
+SEGUNDOS_MINIMOS = 0.05
+# cada cuánto se muestrea la memoria de los procesos hijos
+INTERVALO_MUESTREO = 0.02
+
+
+def medir(path_csv, path_db, procesos=0):
+    """
+    Corre el ETL completo sobre path_csv contra una base nueva en path_db y devuelve, por
+    etapa, segundos de reloj, sentencias SQL ejecutadas y memoria residente (KB), más el
+    detalle por sitio de llamada de instrumentacion.estadisticas. La memoria se informa como:
+    - rss_pico_etapa_kb: pico de RSS de este proceso durante la etapa (se reinicia la marca
+      VmHWM de Linux antes de cada etapa). Donde no se puede reiniciar queda en None y se
+      agrega rss_pico_acumulado_kb, el pico desde que arrancó el proceso (ru_maxrss).
+    - rss_pico_hijos_kb: máximo de la suma del RSS de los procesos hijos durante la etapa
+      (los de procesar_csv_en_paralelo), muestreado cada INTERVALO_MUESTREO segundos; 0 si
+      la etapa no lanza procesos. ru_maxrss de RUSAGE_CHILDREN no sirve: los hijos heredan
+      la marca de pico del padre al crearse.
+    Con procesos > 0 mide además procesar_csv_en_paralelo contra otra base nueva.
+    Se corre en un proceso aparte por tamaño para que los picos de RSS y las cachés de cada
+    medición no arrastren lo de la anterior.
+    """
+    from modelo_orm2 import db, configurar_db
+    from gestionar_obras import GestionarObra
+    from instrumentacion import estadisticas
+
+    sentencias = [0]
+
+    def contar(_sql):
+        sentencias[0] += 1
+
+    def abrir(path):
+        configurar_db(path)
+        db.connect()  # conexión abierta toda la medición: conexion() la reutiliza y el contador no se pierde
+        db.connection().set_trace_callback(contar)
+        GestionarObra.mapear_orm()
+
+    abrir(path_db)
+
+    resultados = {}
+
+    def etapa(nombre, funcion):
+        sentencias[0] = 0
+        reiniciada = _reiniciar_pico_rss()
+        with _pico_rss_hijos() as hijos:
+            inicio = time.perf_counter()
+            salida = funcion()
+            segundos = time.perf_counter() - inicio
+        metrica = resultados[nombre] = {
+            'segundos': round(segundos, 4),
+            'rss_pico_etapa_kb': _pico_rss_kb() if reiniciada else None,
+            'rss_pico_hijos_kb': hijos['pico_kb'],
+            'sentencias_sql': sentencias[0],
+        }
+        if not reiniciada:
+            metrica['rss_pico_acumulado_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return salida
+
+    df = etapa('extraer_datos', lambda: GestionarObra.extraer_datos(path_csv))
+    df_limpio = etapa('limpiar_datos', lambda: GestionarObra.limpiar_datos(df))
+    reporte = etapa('cargar_datos', lambda: GestionarObra.cargar_datos(df_limpio))
+    etapa('indicadores_frio', lambda: GestionarObra.obtener_indicadores(mostrar=False))
+    etapa('indicadores_caliente', lambda: GestionarObra.obtener_indicadores(mostrar=False))
+    db.close()
+    if procesos:
+        abrir(path_db + '-paralelo')
+        etapa('procesar_csv_en_paralelo', lambda: GestionarObra.procesar_csv_en_paralelo(path_csv, procesos=procesos))
+        db.close()
+
+    filas = len(df) if df is not None else 0
+    cargados = reporte['cargados'] if reporte else 0
+    for nombre, metrica in resultados.items():
+        if nombre not in ('indicadores_frio', 'indicadores_caliente') and metrica['segundos'] > 0:
+            metrica['filas_por_segundo'] = round(filas / metrica['segundos'])
+    return {'filas': filas, 'cargados': cargados, 'etapas': resultados, 'sitios': estadisticas.resumen()}
+
+
+def _reiniciar_pico_rss():
+    # En Linux escribir 5 en clear_refs lleva VmHWM (el pico de RSS) al RSS actual
+    try:
+        with open('/proc/self/clear_refs', 'w') as archivo:
+            archivo.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _pico_rss_kb():
+    return _campo_status('/proc/self/status', 'VmHWM:')
+
+
+def _campo_status(path, campo):
+    # Valor en KB de un campo de /proc/<pid>/status, o None si el proceso ya no existe
+    try:
+        with open(path) as archivo:
+            for linea in archivo:
+                if linea.startswith(campo):
+                    return int(linea.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _pids_hijos():
+    pids = []
+    for tarea in glob.glob('/proc/self/task/*/children'):
+        try:
+            with open(tarea) as archivo:
+                pids.extend(archivo.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+@contextlib.contextmanager
+def _pico_rss_hijos():
+    # Un hilo suma el RSS actual de los hijos cada INTERVALO_MUESTREO mientras dura el bloque
+    resultado = {'pico_kb': 0}
+    terminar = threading.Event()
+
+    def muestrear():
+        while True:
+            total = sum(_campo_status(f'/proc/{pid}/status', 'VmRSS:') or 0 for pid in _pids_hijos())
+            resultado['pico_kb'] = max(resultado['pico_kb'], total)
+            if terminar.wait(INTERVALO_MUESTREO):
+                return
+
+    hilo = threading.Thread(target=muestrear, daemon=True)
+    hilo.start()
+    try:
+        yield resultado
+    finally:
+        terminar.set()
+        hilo.join()
+
+
+def correr(tamanos, directorio_datos, semilla, procesos=0):
+    from generar_dataset import generar_dataset
+
+    os.makedirs(directorio_datos, exist_ok=True)
+    corridas = []
+    for tamano in tamanos:
+        path_csv = os.path.join(directorio_datos, f'obras_{tamano}_s{semilla}.csv')
+        if not os.path.exists(path_csv):
+            print(f"Generando dataset de {tamano} filas en {path_csv}...", file=sys.stderr)
+            generar_dataset(tamano, path_csv, semilla=semilla)
+        with tempfile.TemporaryDirectory() as temporal:
+            proceso = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--medir', path_csv, os.path.join(temporal, 'obras.db'),
+                 '--procesos', str(procesos)],
+                stdout=subprocess.PIPE, check=True, text=True)
+        medicion = json.loads(proceso.stdout)
+        medicion['tamano'] = tamano
+        corridas.append(medicion)
+        print(_resumen(medicion), file=sys.stderr)
+    return corridas
+
+
+def entorno():
+    import numpy
+    import pandas
+    import peewee
+    import sqlite3
+
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pandas': pandas.__version__,
+        'numpy': numpy.__version__,
+        'peewee': peewee.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'commit': _commit_actual(),
+    }
+
+
+def comparar(actual, base, tolerancia):
+    """
+    Devuelve las regresiones de actual respecto de base: etapas más lentas que base * (1 + tolerancia)
+    o que ejecutan más sentencias SQL que antes. Solo se comparan los tamaños presentes en ambas corridas.
+    """
+    previas = {corrida['tamano']: corrida for corrida in base['corridas']}
+    regresiones = []
+    for corrida in actual['corridas']:
+        previa = previas.get(corrida['tamano'])
+        if previa is None:
+            continue
+        for nombre, metrica in corrida['etapas'].items():
+            anterior = previa['etapas'].get(nombre)
+            if anterior is None:
+                continue
+            if (metrica['segundos'] > anterior['segundos'] * (1 + tolerancia)
+                    and metrica['segundos'] - anterior['segundos'] > SEGUNDOS_MINIMOS):
+                regresiones.append(f"{corrida['tamano']} filas, {nombre}: "
+                                   f"{anterior['segundos']}s -> {metrica['segundos']}s")
+            if metrica['sentencias_sql'] > anterior['sentencias_sql']:
+                regresiones.append(f"{corrida['tamano']} filas, {nombre}: "
+                                   f"{anterior['sentencias_sql']} -> {metrica['sentencias_sql']} sentencias SQL")
+    return regresiones
+
+
+def _resumen(medicion):
+    lineas = [f"{medicion['tamano']} filas ({medicion['cargados']} cargadas):"]
+    for nombre, metrica in medicion['etapas'].items():
+        # pico de la etapa, o el acumulado del proceso (marcado con ~) si no se pudo medir por etapa
+        pico = metrica['rss_pico_etapa_kb']
+        memoria = f"{pico // 1024:>7} MB" if pico is not None else f"~{metrica['rss_pico_acumulado_kb'] // 1024:>6} MB"
+        if metrica['rss_pico_hijos_kb']:
+            memoria += f" (+{metrica['rss_pico_hijos_kb'] // 1024} MB en procesos hijos)"
+        lineas.append(f"  {nombre:<22}{metrica['segundos']:>9.3f}s {memoria} {metrica['sentencias_sql']:>9} SQL")
+    return '\n'.join(lineas)
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark de las etapas del ETL de obras urbanas.")
+    parser.add_argument('--tamanos', type=int, nargs='+', default=TAMANOS, help="filas de cada dataset")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--datos', default=os.path.join(DIRECTORIO, 'datos'), help="dónde guardar los CSV generados")
+    parser.add_argument('--salida', help="archivo JSON de resultados (por defecto, benchmarks/resultados/etl-<fecha>.json)")
+    parser.add_argument('--comparar', metavar='BASE_JSON', help="corrida anterior contra la cual buscar regresiones")
+    parser.add_argument('--tolerancia', type=float, default=0.20, help="margen de tiempo aceptado al comparar (0.20 = 20%%)")
+    parser.add_argument('--procesos', type=int, default=0,
+                        help="si es mayor que 0, mide también la ingesta en paralelo con esa cantidad de procesos")
+    parser.add_argument('--medir', nargs=2, metavar=('CSV', 'DB'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:
+        # modo interno: los mensajes del ETL van a stderr y stdout queda solo para el JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            medicion = medir(*args.medir, procesos=args.procesos)
+        print(json.dumps(medicion))
+        sys.exit(0)
+
+    resultado = {'entorno': entorno(), 'corridas': correr(args.tamanos, args.datos, args.semilla, args.procesos)}
+    salida = args.salida or os.path.join(DIRECTORIO, 'resultados',
+                                         f"etl-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as archivo:
+        json.dump(resultado, archivo, indent=2)
+    print(f"Resultados guardados en {salida}", file=sys.stderr)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            regresiones = comparar(resultado, json.load(archivo), args.tolerancia)
+        for regresion in regresiones:
+            print(f"REGRESIÓN: {regresion}", file=sys.stderr)
+        sys.exit(1 if regresiones else 0)
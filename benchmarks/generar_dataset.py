@@ -0,0 +1,66 @@
+# generar_dataset.py
+# Genera exportaciones sintéticas con el mismo esquema que observatorio-de-obras-urbanas.csv
+# (separador ';', las mismas 54 columnas) a partir de filas reales muestreadas con reemplazo.
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_ORIGEN = os.path.join(RAIZ, 'observatorio-de-obras-urbanas.csv')
+
+
+def generar_dataset(cantidad_filas, path_salida, path_origen=CSV_ORIGEN, semilla=0, tamano_lote=100000):
+    """
+    Escribe path_salida con cantidad_filas filas. Cada fila es una fila real del export
+    (con sus valores sucios tal cual vienen) a la que se le cambia el nombre para que sea
+    única y se le varían monto, coordenadas, avance y plazo. Se genera por lotes, así que
+    la memoria no depende de cantidad_filas.
+    """
+    with open(path_origen, encoding='utf-8', newline='') as archivo:
+        encabezado = archivo.readline()
+    origen = pd.read_csv(path_origen, sep=';', dtype=str, keep_default_na=False)
+    generador = np.random.default_rng(semilla)
+
+    with open(path_salida, 'w', encoding='utf-8', newline='') as salida:
+        salida.write(encabezado)
+        escritas = 0
+        while escritas < cantidad_filas:
+            n = min(tamano_lote, cantidad_filas - escritas)
+            lote = origen.iloc[generador.integers(0, len(origen), n)].reset_index(drop=True)
+            numero = pd.Series(np.arange(escritas, escritas + n)).astype(str)
+            lote['nombre'] = lote['nombre'] + ' #' + numero
+
+            monto = generador.lognormal(16, 1.5, n)
+            lote['monto_contrato'] = _formato_monto(monto)
+            lote['lat'] = _formato_decimal(-34.62 + generador.normal(0, 0.04, n), 8)
+            lote['lng'] = _formato_decimal(-58.44 + generador.normal(0, 0.05, n), 8)
+            lote['porcentaje_avance'] = _formato_decimal(generador.uniform(0, 100, n), 2)
+            lote['plazo_meses'] = generador.integers(1, 48, n).astype(str)
+
+            lote.to_csv(salida, sep=';', index=False, header=False)
+            escritas += n
+    return path_salida
+
+
+def _formato_monto(valores):
+    # "$67.065.700,00": miles con punto y decimales con coma, como el export original
+    enteros = pd.Series(np.floor(valores).astype(np.int64)).map('{:,}'.format).str.replace(',', '.', regex=False)
+    centavos = pd.Series(np.round((valores % 1) * 100).astype(np.int64).clip(0, 99)).astype(str).str.zfill(2)
+    return '$' + enteros + ',' + centavos
+
+
+def _formato_decimal(valores, decimales):
+    return pd.Series(np.round(valores, decimales)).astype(str).str.replace('.', ',', regex=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Genera un CSV sintético de obras urbanas.")
+    parser.add_argument('filas', type=int, help="cantidad de filas a generar")
+    parser.add_argument('salida', help="ruta del CSV a escribir")
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args()
+    generar_dataset(args.filas, args.salida, semilla=args.semilla)
+    print(f"Generado {args.salida} con {args.filas} filas.", file=sys.stderr)
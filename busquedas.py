@@ -0,0 +1,70 @@
+# busquedas.py
+# Búsquedas de obras por ubicación (índice espacial) y por texto (índice de texto completo).
+# Solo depende de peewee y modelo_orm2, así que se puede usar sin importar pandas.
+import re
+
+from modelo_orm2 import Etapa, Comuna, Obra, rectangulo_de_radio, distancia_metros
+
+# Media circunferencia terrestre: un círculo de este radio ya cubre toda la esfera
+RADIO_MAXIMO_METROS = 2.1e7
+
+
+def obras_en_rectangulo(lat_min, lng_min, lat_max, lng_max, etapa=None, comuna=None):
+    """Obras cuyas coordenadas caen dentro del rectángulo, filtradas por etapa y comuna."""
+    return list(filtrar_obras(Obra.en_rectangulo(lat_min, lng_min, lat_max, lng_max), etapa, comuna))
+
+
+def obras_en_radio(lat, lng, radio_metros, etapa=None, comuna=None):
+    """
+    Lista de (obra, distancia en metros) a menos de radio_metros del punto, de la más cercana
+    a la más lejana. El índice espacial acota la búsqueda al rectángulo que contiene el
+    círculo; la distancia exacta se calcula solo sobre esas.
+    """
+    consulta = filtrar_obras(Obra.en_rectangulo(*rectangulo_de_radio(lat, lng, radio_metros)), etapa, comuna)
+    encontradas = [(obra, distancia_metros(lat, lng, obra.lat, obra.lng)) for obra in consulta]
+    return sorted([(obra, distancia) for obra, distancia in encontradas if distancia <= radio_metros],
+                  key=lambda par: (par[1], par[0].id))
+
+
+def obras_cercanas(lat, lng, k=10, etapa=None, comuna=None, radio_inicial=500):
+    """
+    Las k obras más cercanas al punto como lista de (obra, distancia en metros). Busca en un
+    radio que se cuadruplica hasta encontrar k obras: cualquier obra fuera del radio está
+    más lejos que las encontradas, así que el resultado es exacto.
+    """
+    radio = radio_inicial
+    while True:
+        encontradas = obras_en_radio(lat, lng, radio, etapa, comuna)
+        if len(encontradas) >= k or radio >= RADIO_MAXIMO_METROS:
+            return encontradas[:k]
+        radio *= 4
+
+
+def buscar_texto(texto, limite=20, etapa=None, comuna=None):
+    """
+    Lista de (obra, relevancia) con las obras que tienen todas las palabras de texto en su
+    nombre o descripción, de la más a la menos relevante.
+    """
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return []
+    return [(obra, obra.relevancia) for obra in filtrar_obras(Obra.buscar_texto(consulta), etapa, comuna).limit(limite)]
+
+
+def consulta_fts(texto):
+    # Cada palabra va entre comillas para que FTS5 no interprete operadores (AND, NEAR, -, ...);
+    # un * al final de la palabra se conserva para buscar por prefijo
+    palabras = re.findall(r'(\w+)(\*?)', texto)
+    return ' '.join(f'"{palabra}"{prefijo}' for palabra, prefijo in palabras)
+
+
+def filtrar_obras(consulta, etapa=None, comuna=None):
+    # Las obras removidas por la sincronización no se listan.
+    # Etapa y comuna se resuelven con subconsultas sobre los índices únicos de nombre y número,
+    # así el filtro ve siempre lo que hay en la base y no depende de lo cargado en la caché
+    consulta = consulta.where(Obra.condicion_vigente())
+    if etapa is not None:
+        consulta = consulta.where(Obra.etapa.in_(Etapa.select(Etapa.id).where(Etapa.nombre == etapa)))
+    if comuna is not None:
+        consulta = consulta.where(Obra.comuna.in_(Comuna.select(Comuna.id).where(Comuna.numero == comuna)))
+    return consulta
@@ -5,132 +5,953 @@ import peewee
 from peewee import OperationalError, fn
 from abc import ABC, abstractmethod
 import datetime
+import codecs
+import hashlib
+import json
+import io
+import os
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 # Importamos los modelos definidos en modelo_orm2.py
-from modelo_orm2 import db, Etapa, TipoObra, AreaResponsable, Comuna, Barrio, TipoContratacion, Empresa, Financiamiento, Obra, MODELOS
+from modelo_orm2 import db, conexion, Etapa, TipoObra, AreaResponsable, Comuna, Barrio, TipoContratacion, Empresa, Financiamiento, Obra, HuellaObra, cache_dimensiones
+from modelo_orm2 import crear_esquema, indexacion_diferida
+import busquedas
+from indicadores import motor_indicadores
+from instrumentacion import estadisticas, instrumentado, reportes, configurar_reportes
+from instantanea import InstantaneaColumnar, abrir_vigente, huella_archivo
+
+
+# Columnas del CSV que se mapean a modelo_orm2.Obra; el resto (imágenes, links y
+# las columnas vacías del final) no se leen.
+COLUMNAS_OBRA = [
+    'nombre', 'etapa', 'tipo', 'area_responsable', 'descripcion', 'monto_contrato',
+    'comuna', 'barrio', 'direccion', 'lat', 'lng', 'fecha_inicio', 'fecha_fin_inicial', 'plazo_meses',
+    'porcentaje_avance', 'mano_obra', 'contratacion_tipo', 'nro_contratacion',
+    'licitacion_oferta_empresa', 'expediente-numero', 'financiamiento', 'destacada',
+]
+
+# Columnas del CSV que se copian sin resolver claves foráneas (columna -> campo de Obra).
+CAMPOS_DIRECTOS = {
+    'nombre': 'nombre', 'descripcion': 'descripcion', 'direccion': 'direccion',
+    'lat': 'lat', 'lng': 'lng',
+    'monto_contrato': 'monto_contrato', 'fecha_inicio': 'fecha_inicio',
+    'fecha_fin_inicial': 'fecha_fin_inicial', 'plazo_meses': 'plazo_meses',
+    'porcentaje_avance': 'porcentaje_avance', 'mano_obra': 'mano_obra',
+    'nro_contratacion': 'nro_contratacion', 'expediente-numero': 'nro_expediente',
+    'destacada': 'destacada',
+}
+
+# Columnas del CSV con un nombre de tabla de dimensión opcional (columna = campo de Obra -> Modelo).
+DIMENSIONES_OPCIONALES = {
+    'contratacion_tipo': TipoContratacion,
+    'licitacion_oferta_empresa': Empresa,
+    'financiamiento': Financiamiento,
+}
+
+# Columnas que identifican una fila del origen entre exportaciones (el CSV no trae id).
+COLUMNAS_CLAVE = ['nombre', 'tipo', 'area_responsable', 'comuna', 'barrio', 'direccion']
+
+# Campos de una obra nueva en GestionarObra.crear_obras (los mismos que pide nueva_obra).
+CAMPOS_NUEVA_OBRA = [
+    'nombre', 'descripcion', 'direccion', 'lat', 'lng', 'monto_contrato',
+    'tipo_obra', 'area_responsable', 'comuna', 'barrio',
+]
+
+COLUMNAS_TEXTO = [
+    'nombre', 'etapa', 'tipo', 'area_responsable', 'descripcion', 'barrio', 'direccion',
+    'contratacion_tipo', 'licitacion_oferta_empresa', 'financiamiento',
+]
 
 
 class GestionarObra(ABC):
 
     _dataframe_obras = None
+    _dataframe_rechazos = None
 
     @classmethod 
-    def extraer_datos(cls, path_csv='observatorio-de-obras-urbanas.csv', delimiter=';', encoding='utf-8'):
+    @instrumentado
+    def extraer_datos(cls, path_csv='observatorio-de-obras-urbanas.csv', delimiter=';', encoding=None,
+                      tamano_lote=10000):
         """
         a. Extrae los datos del archivo CSV utilizando pandas y los retorna como un DataFrame.
            Incluye manejo de excepciones para archivo no encontrado y codificación.
+           Es un envoltorio de extraer_datos_por_lotes que junta todos los lotes.
+           Si no se indica encoding se detecta con detectar_codificacion.
         """
         try:
-            print(f"Intentando extraer datos de: {path_csv} con codificación {encoding}")
-            cls._dataframe_obras = pd.read_csv(path_csv, sep=delimiter, encoding=encoding)
-            print("Datos extraídos correctamente.")
+            encoding = encoding or cls.detectar_codificacion(path_csv)
+            reportes.info("Intentando extraer datos de: %s con codificación %s", path_csv, encoding)
+            lotes = list(cls.extraer_datos_por_lotes(path_csv, delimiter, encoding, tamano_lote))
+            if lotes:
+                cls._dataframe_obras = pd.concat(lotes, ignore_index=True)
+            else:
+                cls._dataframe_obras = pd.DataFrame(columns=COLUMNAS_OBRA)
+            estadisticas.agregar_filas(len(cls._dataframe_obras))
+            reportes.info("Datos extraídos correctamente.")
             return cls._dataframe_obras # aca llamamos al csv para extraer los datos
     
         except FileNotFoundError:
-            print(f"ERROR: El archivo '{path_csv}' no fue encontrado. Asegúrate de que esté en la misma carpeta que el script.")
+            reportes.error("ERROR: El archivo '%s' no fue encontrado. Asegúrate de que esté en la misma carpeta que el script.", path_csv)
             return None # Retorna None si no se encuentra el archivo
         
         except UnicodeDecodeError as ude:
-            print(f"ERROR de codificación al leer el CSV: {ude}")
+            reportes.error("ERROR de codificación al leer el CSV: %s", ude)
             return None  # ude es simplificado unicode decode error, que ocurre si el encoding no es correcto
         
         except pd.errors.EmptyDataError:
-            print(f"ERROR: El archivo '{path_csv}' está vacío.")
+            reportes.error("ERROR: El archivo '%s' está vacío.", path_csv)
             return None # Retorna None si el archivo está vacío
         
         except Exception as e:
-            print(f"ERROR inesperado al extraer datos: {e}") # e simplificado de exception, captura cualquier otro error inesperado
+            reportes.error("ERROR inesperado al extraer datos: %s", e) # e simplificado de exception, captura cualquier otro error inesperado
             return None 
 
+    @classmethod
+    @instrumentado
+    def datos_limpios(cls, path_csv='observatorio-de-obras-urbanas.csv', delimiter=';', encoding=None,
+                      columnas=None, directorio_instantaneas=None):
+        """
+        Retorna el DataFrame de extraer_datos + limpiar_datos reutilizando una instantánea
+        columnar (instantanea.InstantaneaColumnar) si el CSV no cambió desde la última vez:
+        se compara tamaño, fecha de modificación y, si hace falta, el hash del contenido.
+        Las columnas se abren con mmap y solo se materializan las pedidas en columnas.
+        Si no hay instantánea vigente, lee y limpia el CSV y la guarda para la próxima.
+        Por defecto las instantáneas van en .instantaneas/ junto al CSV; si no se puede
+        escribirla, se avisa y se retornan igual los datos limpios.
+        Retorna None si falla la lectura.
+        """
+        try:
+            directorio = cls._directorio_instantanea(path_csv, directorio_instantaneas)
+            parametros = {'delimiter': delimiter, 'encoding': encoding}
+            instantanea = abrir_vigente(directorio, path_csv, **parametros)
+            if instantanea is not None:
+                rechazos = abrir_vigente(directorio + '-rechazos', path_csv, **parametros)
+                cls._dataframe_rechazos = (rechazos.a_dataframe()
+                                           if rechazos and rechazos.meta['hash'] == instantanea.meta['hash'] else None)
+                reportes.info("Usando la instantánea de '%s' (%s filas).", path_csv, len(instantanea))
+            else:
+                # Estado del archivo antes de leerlo: si cambia durante la lectura, la próxima vez no coincide
+                estado = os.stat(path_csv)
+                parametros.update(tamano=estado.st_size, mtime_ns=estado.st_mtime_ns, hash=huella_archivo(path_csv))
+                df = cls.extraer_datos(path_csv, delimiter, encoding)
+                if df is None:
+                    return None
+                df_limpio = cls.limpiar_datos(df)
+                if df_limpio is None:
+                    return None
+                instantanea = cls._guardar_instantanea(df_limpio, directorio, parametros)
+                if instantanea is None:
+                    df = df_limpio if columnas is None else df_limpio[[c for c in df_limpio.columns if c in set(columnas)]]
+                    estadisticas.agregar_filas(len(df))
+                    return df
+            df = instantanea.a_dataframe(columnas)
+            estadisticas.agregar_filas(len(df))
+            return df
+        except FileNotFoundError:
+            reportes.error("ERROR: El archivo '%s' no fue encontrado. Asegúrate de que esté en la misma carpeta que el script.", path_csv)
+            return None
+        except OSError as e:
+            reportes.error("ERROR al leer la instantánea de '%s': %s", path_csv, e)
+            return None
+
+    @classmethod
+    def _guardar_instantanea(cls, df_limpio, directorio, parametros):
+        # Si no se puede escribir la instantánea, los datos ya limpios siguen sirviendo:
+        # se avisa y se retorna None para que datos_limpios los use directamente
+        try:
+            InstantaneaColumnar.guardar(cls._dataframe_rechazos, directorio + '-rechazos', **parametros)
+            instantanea = InstantaneaColumnar.guardar(df_limpio, directorio, **parametros)
+        except OSError as e:
+            reportes.warning("No se pudo guardar la instantánea en '%s': %s. Se usan los datos sin instantánea.",
+                             directorio, e)
+            return None
+        reportes.info("Instantánea guardada en: %s", directorio)
+        return instantanea
+
+    @staticmethod
+    def _directorio_instantanea(path_csv, directorio_instantaneas=None):
+        ruta = os.path.abspath(path_csv)
+        directorio_instantaneas = directorio_instantaneas or os.path.join(os.path.dirname(ruta), '.instantaneas')
+        sufijo = hashlib.blake2b(ruta.encode('utf-8'), digest_size=5).hexdigest()
+        return os.path.join(directorio_instantaneas, f'{os.path.basename(ruta)}-{sufijo}')
+
+    @classmethod
+    def extraer_datos_por_lotes(cls, path_csv='observatorio-de-obras-urbanas.csv', delimiter=';', encoding=None,
+                                tamano_lote=10000, columnas=COLUMNAS_OBRA):
+        """
+        Generador que lee el CSV en lotes de tamano_lote filas, conservando solo las
+        columnas indicadas. La memoria usada depende del tamaño del lote y no del archivo.
+        Todas las columnas se leen como texto y los tipos los asigna limpiar_datos: si pandas
+        los infiriera, dependerían de qué filas caen en cada lote (un lote con solo números en
+        nro_contratacion lo leería como float, "2023.0").
+        Las excepciones de lectura se propagan al consumidor.
+        """
+        encoding = encoding or cls.detectar_codificacion(path_csv)
+        columnas = set(columnas)
+        lector = pd.read_csv(path_csv, sep=delimiter, encoding=encoding, chunksize=tamano_lote, dtype=str,
+                             usecols=lambda columna: columna in columnas)
+        with lector:
+            for lote in lector:
+                yield lote
+
+    @classmethod
+    @instrumentado
+    def procesar_csv_por_lotes(cls, path_csv='observatorio-de-obras-urbanas.csv', delimiter=';', encoding=None,
+                               tamano_lote=10000):
+        """
+        Pipeline de ingesta en streaming: cada lote del CSV pasa por limpiar_datos y se
+        carga en su propia transacción antes de leer el siguiente.
+        Retorna un dict con el total de registros cargados y rechazados, o False si falla.
+        'rechazados' cuenta lo mismo que en cargar_datos (filas limpias que no se pudieron
+        cargar); las filas que limpiar_datos descarta van aparte, en 'descartados_limpieza'.
+        """
+        total = {'cargados': 0, 'rechazados': 0, 'descartados_limpieza': 0}
+        rechazos = []
+        reportes.info("Iniciando ingesta por lotes de %s filas desde: %s", tamano_lote, path_csv)
+        try:
+            with conexion():
+                for numero, lote in enumerate(cls.extraer_datos_por_lotes(path_csv, delimiter, encoding, tamano_lote), 1):
+                    lote_limpio = cls.limpiar_datos(lote)
+                    rechazos.append(cls._dataframe_rechazos)
+                    total['descartados_limpieza'] += len(lote) - len(lote_limpio)
+                    if lote_limpio.empty:
+                        continue
+                    with db.atomic():
+                        reporte = cls._cargar_datos_masivo(lote_limpio)
+                    total['cargados'] += reporte['cargados']
+                    total['rechazados'] += reporte['rechazados']
+                    reportes.info("Lote %s: %s registros cargados, %s rechazados.", numero, reporte['cargados'], reporte['rechazados'])
+            if rechazos:
+                cls._dataframe_rechazos = pd.concat(rechazos, ignore_index=True)
+            estadisticas.agregar_filas(sum(total.values()))
+            reportes.info("Ingesta finalizada: %s registros cargados, %s rechazados, %s descartados en la limpieza.",
+                          total['cargados'], total['rechazados'], total['descartados_limpieza'])
+            return total
+        except FileNotFoundError:
+            reportes.error("ERROR: El archivo '%s' no fue encontrado. Asegúrate de que esté en la misma carpeta que el script.", path_csv)
+            return False
+        except UnicodeDecodeError as ude:
+            reportes.error("ERROR de codificación al leer el CSV: %s", ude)
+            return False
+        except pd.errors.EmptyDataError:
+            reportes.error("ERROR: El archivo '%s' está vacío.", path_csv)
+            return False
+        except Exception as e:
+            reportes.error("ERROR inesperado durante la ingesta por lotes: %s", e)
+            return False
+
+    @classmethod
+    @instrumentado
+    def procesar_csv_en_paralelo(cls, path_csv='observatorio-de-obras-urbanas.csv', delimiter=';', encoding=None,
+                                 procesos=None, tamano_fragmento=4 << 20):
+        """
+        Igual que procesar_csv_por_lotes, pero la lectura y limpieza del CSV corre en un pool
+        de procesos: cada proceso recibe un fragmento de unos tamano_fragmento bytes y lo
+        devuelve limpio y normalizado (_normalizar_obras). Este proceso es el único que
+        escribe: resuelve dimensiones e inserta cada fragmento en orden, en su propia
+        transacción, así que la base queda igual que con la ingesta secuencial.
+        Los procesos se crean con 'spawn': el script que lo llame debe proteger su punto de
+        entrada con if __name__ == '__main__'.
+        Retorna un dict con el mismo formato que procesar_csv_por_lotes, o False si falla.
+        """
+        procesos = procesos or os.cpu_count() or 1
+        total = {'cargados': 0, 'rechazados': 0, 'descartados_limpieza': 0}
+        rechazos = []
+        reportes.info("Iniciando ingesta en paralelo con %s procesos desde: %s", procesos, path_csv)
+        try:
+            encoding = encoding or cls.detectar_codificacion(path_csv)
+            fragmentos = cls._fragmentos_csv(path_csv, tamano_fragmento)
+            encabezado = next(fragmentos, b'')
+            # 'spawn': los procesos no heredan la conexión SQLite abierta de este proceso
+            contexto = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(procesos, mp_context=contexto, initializer=configurar_reportes,
+                                     initargs=('error',)) as pool, conexion():
+                en_curso = deque()
+                filas_previas = 0
+
+                def escribir(numero, resultado):
+                    nonlocal filas_previas
+                    normalizado, rechazados, descartados, rechazos_limpieza, filas = resultado
+                    # Los números de fila de los rechazos son relativos al fragmento
+                    rechazos.append(rechazos_limpieza.assign(fila=rechazos_limpieza['fila'] + filas_previas))
+                    filas_previas += filas
+                    total['rechazados'] += rechazados
+                    total['descartados_limpieza'] += descartados
+                    if normalizado.empty:
+                        return
+                    with db.atomic():
+                        with estadisticas.etapa('GestionarObra.procesar_csv_en_paralelo:resolver'):
+                            tabla = cls._resolver_obras(normalizado)
+                            campos = [getattr(Obra, campo) for campo in tabla.columns]
+                            filas_sql = cls._filas_sql(tabla)
+                        with estadisticas.etapa('GestionarObra.procesar_csv_en_paralelo:insertar'), indexacion_diferida():
+                            cls._insertar_filas(Obra, campos, filas_sql)
+                    total['cargados'] += len(filas_sql)
+                    reportes.info("Lote %s: %s registros cargados, %s rechazados.", numero, len(filas_sql), rechazados)
+
+                # Como mucho dos fragmentos por proceso en vuelo: la memoria no depende del archivo
+                for numero, fragmento in enumerate(fragmentos, 1):
+                    en_curso.append(pool.submit(_limpiar_fragmento, encabezado, fragmento, delimiter, encoding))
+                    if len(en_curso) >= 2 * procesos:
+                        escribir(numero - len(en_curso) + 1, en_curso.popleft().result())
+                while en_curso:
+                    escribir(numero - len(en_curso) + 1, en_curso.popleft().result())
+            if rechazos:
+                cls._dataframe_rechazos = pd.concat(rechazos, ignore_index=True)
+            estadisticas.agregar_filas(sum(total.values()))
+            reportes.info("Ingesta finalizada: %s registros cargados, %s rechazados, %s descartados en la limpieza.",
+                          total['cargados'], total['rechazados'], total['descartados_limpieza'])
+            return total
+        except FileNotFoundError:
+            reportes.error("ERROR: El archivo '%s' no fue encontrado. Asegúrate de que esté en la misma carpeta que el script.", path_csv)
+            return False
+        except UnicodeDecodeError as ude:
+            reportes.error("ERROR de codificación al leer el CSV: %s", ude)
+            return False
+        except pd.errors.EmptyDataError:
+            reportes.error("ERROR: El archivo '%s' está vacío.", path_csv)
+            return False
+        except Exception as e:
+            reportes.error("ERROR inesperado durante la ingesta en paralelo: %s", e)
+            return False
+
+    @staticmethod
+    def _fragmentos_csv(path_csv, tamano_fragmento=4 << 20):
+        """
+        Generador que lee el CSV en bytes y produce primero la línea de encabezado y luego
+        fragmentos de unos tamano_fragmento bytes que terminan en fin de registro. Un campo
+        entre comillas puede contener saltos de línea, así que un salto de línea solo cierra
+        un registro si antes hay una cantidad par de comillas (las comillas escapadas van
+        dobles y no alteran la paridad).
+        """
+        with open(path_csv, 'rb') as archivo:
+            pendiente = b''
+            encabezado_leido = False
+            while True:
+                bloque = archivo.read(tamano_fragmento)
+                datos = pendiente + bloque
+                if not encabezado_leido:
+                    corte = _primer_fin_de_registro(datos)
+                    if corte < 0 and bloque:
+                        pendiente = datos
+                        continue
+                    corte = len(datos) - 1 if corte < 0 else corte
+                    yield datos[:corte + 1]
+                    datos = datos[corte + 1:]
+                    encabezado_leido = True
+                if not bloque:
+                    if datos.strip():
+                        yield datos
+                    return
+                corte = _ultimo_fin_de_registro(datos)
+                if corte < 0:
+                    pendiente = datos
+                    continue
+                yield datos[:corte + 1]
+                pendiente = datos[corte + 1:]
+
+    @staticmethod
+    @instrumentado
+    def detectar_codificacion(path_csv, tamano_bloque=1 << 20):
+        """
+        Retorna 'utf-8' si el archivo completo es UTF-8 válido y 'latin-1' en caso contrario.
+        Recorre el archivo por bloques con un decodificador incremental.
+        """
+        decodificador = codecs.getincrementaldecoder('utf-8')()
+        try:
+            with open(path_csv, 'rb') as archivo:
+                while bloque := archivo.read(tamano_bloque):
+                    decodificador.decode(bloque)
+                decodificador.decode(b'', final=True)
+        except UnicodeDecodeError:
+            return 'latin-1'
+        return 'utf-8'
+
     @classmethod
     def conectar_db(cls):
         try:
-            db.connect()
-            print("Conexión a la base de datos 'obras_urbanas.db' establecida correctamente.")
+            db.connect(reuse_if_open=True)
+            reportes.info("Conexión a la base de datos '%s' establecida correctamente.", db.database)
             return True
         except OperationalError as e:
-            print(f"ERROR: No se pudo conectar a la base de datos. {e}")
+            reportes.error("ERROR: No se pudo conectar a la base de datos. %s", e)
             return False
         except Exception as e:
-            print(f"ERROR inesperado al conectar la base de datos: {e}")
+            reportes.error("ERROR inesperado al conectar la base de datos: %s", e)
             return False
 
     @classmethod
+    @instrumentado
     def mapear_orm(cls): #crea tablas y relaciones en la base de datos
         try:
-            db.create_tables(MODELOS) # en modelos esta los nombres de las tablas
-            print("Tablas de la base de datos creadas/verificadas correctamente.")
+            with conexion():
+                crear_esquema()
+            reportes.info("Tablas de la base de datos creadas/verificadas correctamente.")
             return True
         except OperationalError as e:
-            print(f"ERROR: No se pudieron crear las tablas de la base de datos. {e}")
+            reportes.error("ERROR: No se pudieron crear las tablas de la base de datos. %s", e)
             return False
         except Exception as e:
-            print(f"ERROR inesperado al mapear ORM: {e}")
+            reportes.error("ERROR inesperado al mapear ORM: %s", e)
             return False
     
 
     
     @classmethod
+    @instrumentado
     def limpiar_datos(cls, df):
+        """
+        b. Limpia y normaliza el DataFrame con operaciones vectorizadas:
+           repara texto mal decodificado, convierte montos, coordenadas, fechas y
+           cantidades a columnas numéricas y de fecha, y descarta filas sin campos clave.
+           Los valores que no se pueden convertir quedan en NaN y se registran en
+           _dataframe_rechazos (fila, columna, valor, motivo) en lugar de lanzar errores.
+        """
+        rechazos = []
+
         # Elimina filas completamente vacías
-        df_limpio = df.dropna(how='all')
+        df_limpio = df.dropna(how='all').copy()
+
+        for columna in COLUMNAS_TEXTO:
+            if columna in df_limpio:
+                df_limpio[columna] = cls._reparar_texto(df_limpio[columna])
 
         # Elimina filas donde los campos clave están vacíos o NaN
         campos_clave = ['nombre', 'etapa', 'tipo', 'area_responsable']
-        df_limpio = df_limpio.dropna(subset=campos_clave, how='any')
+        faltantes = df_limpio[campos_clave].isna()
+        sin_clave = faltantes.any(axis=1)
+        if sin_clave.any():
+            rechazos.append(pd.DataFrame({
+                'fila': df_limpio.index[sin_clave],
+                'columna': faltantes[sin_clave].dot(pd.Index(campos_clave) + ',').str.rstrip(','),
+                'valor': None,
+                'motivo': 'campo clave vacío',
+            }))
+        df_limpio = df_limpio[~sin_clave]
 
-        print("Datos limpiados y normalizados.")
+        conversiones = {
+            'monto_contrato': lambda serie: cls._a_numero(serie, miles_con_un_punto=True, minimo=0),
+            'lat': lambda serie: cls._a_coordenada(serie, 90),
+            'lng': lambda serie: cls._a_coordenada(serie, 180),
+            'fecha_inicio': cls._a_fecha,
+            'fecha_fin_inicial': cls._a_fecha,
+            'plazo_meses': lambda serie: cls._a_entero(serie, minimo=0),
+            'porcentaje_avance': lambda serie: cls._a_numero(serie, minimo=0, maximo=100),
+            'mano_obra': lambda serie: cls._a_entero(serie, minimo=0),
+            'comuna': cls._a_comuna,
+        }
+        for columna, convertir in conversiones.items():
+            if columna not in df_limpio:
+                continue
+            original = df_limpio[columna]
+            df_limpio[columna], invalidos = convertir(original)
+            if invalidos.any():
+                rechazos.append(pd.DataFrame({
+                    'fila': original.index[invalidos],
+                    'columna': columna,
+                    'valor': original[invalidos].astype(object),
+                    'motivo': 'valor no convertible',
+                }))
+
+        columnas_rechazos = ['fila', 'columna', 'valor', 'motivo']
+        cls._dataframe_rechazos = (pd.concat(rechazos, ignore_index=True) if rechazos
+                                   else pd.DataFrame(columns=columnas_rechazos))
+
+        irrecuperables = sum(int(df_limpio[columna].str.contains('\ufffd', regex=False).sum())
+                             for columna in COLUMNAS_TEXTO
+                             if columna in df_limpio and pd.api.types.is_string_dtype(df_limpio[columna]))
+        if irrecuperables:
+            reportes.warning("AVISO: %s valores de texto contienen caracteres irrecuperables (U+FFFD) en el origen.", irrecuperables)
+
+        estadisticas.agregar_filas(len(df))
+        reportes.info("Datos limpiados y normalizados. Valores rechazados: %s.", len(cls._dataframe_rechazos))
         return df_limpio
 
+    @staticmethod
+    def _como_texto(datos):
+        # astype(str) conserva los faltantes en pandas 3, pero en pandas 2 los vuelve 'nan':
+        # se enmascaran para que un valor faltante nunca pase por texto
+        return datos.astype(str).where(datos.notna())
+
+    @staticmethod
+    def _reparar_texto(serie):
+        # Repara texto UTF-8 que fue leído como Latin-1 ("EducaciÃ³n" -> "Educación")
+        if not pd.api.types.is_string_dtype(serie):
+            return serie
+        serie = GestionarObra._como_texto(serie)
+        mal_decodificado = serie.str.contains('[ÃÂ][\x80-\xbf]', regex=True, na=False)
+        if mal_decodificado.any():
+            reparado = (serie[mal_decodificado].str.encode('latin-1', errors='ignore')
+                                               .str.decode('utf-8', errors='replace'))
+            serie = serie.mask(mal_decodificado, reparado)
+        return serie
+
+    @staticmethod
+    def _a_numero(serie, miles_con_un_punto=False, minimo=None, maximo=None):
+        """
+        Convierte texto con formatos mixtos ("$67.065.700,00", "74,27", "40.78", "100%")
+        a float. El separador decimal es el último que aparece si hay ambos; un separador
+        repetido es de miles. Retorna (valores, máscara de valores no convertibles).
+        """
+        if pd.api.types.is_numeric_dtype(serie):
+            valores = serie.astype('float64')
+        else:
+            texto = serie.astype(str).str.replace(r'[\s$%\ufffd]', '', regex=True).where(serie.notna())
+            comas = texto.str.count(',')
+            puntos = texto.str.count(r'\.')
+            coma_decimal = (comas == 1) & ((puntos == 0) | (texto.str.rfind(',') > texto.str.rfind('.')))
+            puntos_de_miles = (comas == 0) & ((puntos > 1) | (
+                miles_con_un_punto & texto.str.fullmatch(r'-?\d{1,3}\.\d{3}', na=False)))
+            normalizado = texto.str.replace(',', '', regex=False)
+            normalizado = normalizado.mask(puntos_de_miles, texto.str.replace('.', '', regex=False))
+            normalizado = normalizado.mask(coma_decimal, texto.str.replace('.', '', regex=False)
+                                                              .str.replace(',', '.', regex=False))
+            valores = pd.to_numeric(normalizado.mask(normalizado == ''), errors='coerce').astype('float64')
+        fuera_de_rango = pd.Series(False, index=serie.index)
+        if minimo is not None:
+            fuera_de_rango |= valores < minimo
+        if maximo is not None:
+            fuera_de_rango |= valores > maximo
+        valores = valores.mask(fuera_de_rango)
+        vacios = serie.isna() | serie.astype(str).str.strip().eq('')
+        return valores, valores.isna() & ~vacios
+
     @classmethod
-    def cargar_datos(cls, df_limpio):
+    def _a_coordenada(cls, serie, limite):
+        # Las coordenadas del export a veces pierden el punto decimal ("-34658478") o traen
+        # puntos de miles ("-34.578.254"); se reescalan por potencias de 10 hasta entrar en rango.
+        valores, invalidos = cls._a_numero(serie)
+        exceso = np.ceil(np.log10(valores.abs().where(valores.abs() > limite) / limite))
+        valores = valores / np.power(10.0, exceso.fillna(0))
+        return valores, invalidos
+
+    @classmethod
+    def _a_entero(cls, serie, minimo=None):
+        valores, invalidos = cls._a_numero(serie, miles_con_un_punto=True, minimo=minimo)
+        return valores.round().astype('Int64'), invalidos
+
+    @classmethod
+    def _a_comuna(cls, serie):
+        # Solo se acepta un número de comuna; listas como "1 y 4" quedan sin comuna
+        validos = cls._enteros_validos(serie)
+        valores = pd.to_numeric(serie.where(validos), errors='coerce').astype('Int64')
+        return valores, serie.notna() & ~validos
+
+    @staticmethod
+    def _a_fecha(serie):
+        # Formato ISO del export, con alternativas dd/mm/aaaa y mm/aa (primer día del mes)
+        texto = serie.astype(str).str.strip().where(serie.notna())
+        fechas = pd.to_datetime(texto, format='%Y-%m-%d', errors='coerce')
+        for formato in ('%d/%m/%Y', '%m/%y'):
+            fechas = fechas.fillna(pd.to_datetime(texto.where(fechas.isna()), format=formato, errors='coerce'))
+        return fechas, fechas.isna() & texto.notna() & texto.ne('')
+
+    @classmethod
+    @instrumentado
+    def cargar_datos(cls, df_limpio, masivo=True, tamano_lote=500):
+        """
+        c. Carga el DataFrame limpio en la base de datos.
+           Por defecto usa la carga masiva: resuelve cada tabla de dimensión una sola vez
+           y escribe las obras con insert_many en lotes. Con masivo=False se usa la carga
+           fila por fila original. Retorna un dict con registros cargados y rechazados,
+           o False si la carga falla.
+        """
         if df_limpio is None or df_limpio.empty:
-            print("No hay DataFrame limpio para cargar. Ejecuta 'limpiar_datos' primero.")
+            reportes.warning("No hay DataFrame limpio para cargar. Ejecuta 'limpiar_datos' primero.")
+            return False
+
+        reportes.info("Iniciando carga de datos a la base de datos...")
+        try:
+            with conexion(), db.atomic():
+                if masivo:
+                    reporte = cls._cargar_datos_masivo(df_limpio, tamano_lote)
+                else:
+                    reporte = cls._cargar_datos_por_fila(df_limpio)
+            estadisticas.agregar_filas(len(df_limpio))
+            reportes.info("Carga finalizada: %s registros cargados, %s rechazados.", reporte['cargados'], reporte['rechazados'])
+            return reporte
+        except Exception as e:
+            reportes.error("ERROR inesperado durante la carga de datos: %s", e)
+            return False
+
+    @classmethod
+    def _cargar_datos_por_fila(cls, df_limpio):
+        cargados = 0
+        rechazados = 0
+        for index, row in df_limpio.iterrows():
+            campos_importantes = ['nombre', 'etapa', 'tipo', 'area_responsable']
+            # Si falta algún campo importante, no lo cargues
+            if any(pd.isna(row[campo]) for campo in campos_importantes if campo in row):
+                rechazados += 1
+                continue
+
+            try:
+                etapa_obj, _ = Etapa.get_or_create(nombre=str(row['etapa']).strip() if pd.notna(row['etapa']) else None)
+                tipo_obra_obj, _ = TipoObra.get_or_create(nombre=str(row['tipo']).strip() if pd.notna(row['tipo']) else None)
+                area_responsable_obj, _ = AreaResponsable.get_or_create(nombre=str(row['area_responsable']).strip() if pd.notna(row['area_responsable']) else None)
+                comuna_obj = None
+                if pd.notna(row['comuna']):
+                    comuna_obj, _ = Comuna.get_or_create(numero=int(row['comuna']))
+                barrio_obj = None
+                if pd.notna(row['barrio']) and comuna_obj:
+                    barrio_obj, _ = Barrio.get_or_create(nombre=str(row['barrio']).strip(), comuna=comuna_obj)
+
+                directos = {campo: row[columna] for columna, campo in CAMPOS_DIRECTOS.items()
+                            if columna in row and pd.notna(row[columna])}
+                for columna, Modelo in DIMENSIONES_OPCIONALES.items():
+                    if columna in row and pd.notna(row[columna]) and str(row[columna]).strip():
+                        directos[columna], _ = Modelo.get_or_create(nombre=str(row[columna]).strip())
+                Obra.create(
+                    **directos,
+                    tipo_obra=tipo_obra_obj,
+                    area_responsable=area_responsable_obj,
+                    etapa=etapa_obj,
+                    comuna=comuna_obj,
+                    barrio=barrio_obj
+                )
+                cargados += 1
+                reportes.debug("Registro %s cargado correctamente.", index)
+            except Exception as e:
+                rechazados += 1
+                reportes.warning("Error al cargar el registro %s: %s", index, e)
+        return {'cargados': cargados, 'rechazados': rechazados}
+
+    @classmethod
+    def _cargar_datos_masivo(cls, df_limpio, tamano_lote=500):
+        """
+        Carga basada en conjuntos: las dimensiones se resuelven a partir de los valores
+        distintos del DataFrame y los ids se mapean como columnas vectorizadas.
+        Produce el mismo contenido que la carga fila por fila.
+        """
+        with estadisticas.etapa('GestionarObra.cargar_datos:preparar'):
+            tabla, rechazados = cls._preparar_obras(df_limpio)
+            campos = [getattr(Obra, campo) for campo in tabla.columns]
+            filas = cls._filas_sql(tabla)
+        with estadisticas.etapa('GestionarObra.cargar_datos:insertar'), indexacion_diferida():
+            cls._insertar_filas(Obra, campos, filas, tamano_lote)
+        return {'cargados': len(filas), 'rechazados': rechazados}
+
+    @staticmethod
+    def _insertar_filas(Modelo, campos, filas, tamano_lote=500, **on_conflict):
+        """
+        Inserta filas ya convertidas a valores SQL. El INSERT (con su ON CONFLICT, si se
+        indica) se arma una sola vez con peewee y se ejecuta con executemany: generar el
+        SQL de insert_many fila por fila era el costo dominante de la carga.
+        """
+        if not filas:
+            return
+        consulta = Modelo.insert_many(filas[:1], fields=campos)
+        if on_conflict:
+            consulta = consulta.on_conflict(**on_conflict)
+        sql, _ = consulta.sql()
+        cursor = db.cursor()
+        for lote in peewee.chunked(filas, tamano_lote):
+            inicio = time.perf_counter()
+            cursor.executemany(sql, lote)
+            estadisticas.registrar_sql(time.perf_counter() - inicio, sql, sentencias=len(lote))
+
+    @classmethod
+    def _preparar_obras(cls, df_limpio):
+        """
+        Resuelve las dimensiones del DataFrame limpio y retorna (tabla, rechazados), donde
+        tabla tiene una columna por campo de Obra y solo las filas que se pueden cargar.
+        """
+        normalizado, rechazados = cls._normalizar_obras(df_limpio)
+        return cls._resolver_obras(normalizado), rechazados
+
+    @classmethod
+    def _normalizar_obras(cls, df_limpio):
+        """
+        Parte de _preparar_obras que no usa la base: retorna (normalizado, rechazados), con
+        una columna por campo de Obra donde las claves foráneas todavía son valores (nombre de
+        etapa, número de comuna, ...) y la columna 'cargable' marca las filas a insertar.
+        """
+        df = df_limpio.dropna(subset=['nombre', 'etapa', 'tipo', 'area_responsable'], how='any')
+        rechazados = len(df_limpio) - len(df)
+
+        # limpiar_datos ya deja vacías las comunas inválidas (_a_comuna), así que con su salida
+        # esto no rechaza nada; queda para DataFrames armados por otro camino, que la carga
+        # fila por fila también rechazaría al convertir la comuna.
+        comuna_valida = cls._enteros_validos(df['comuna'])
+        invalidas = df['comuna'].notna() & ~comuna_valida
+        rechazados += int(invalidas.sum())
+
+        columnas = {campo: df[columna] for columna, campo in CAMPOS_DIRECTOS.items() if columna in df}
+        columnas.update({
+            'tipo_obra': df['tipo'].astype(str).str.strip(),
+            'area_responsable': df['area_responsable'].astype(str).str.strip(),
+            'etapa': df['etapa'].astype(str).str.strip(),
+            'comuna': pd.to_numeric(df['comuna'].where(comuna_valida), errors='coerce').astype('Int64'),
+            'barrio': df['barrio'].astype(str).str.strip().where(df['barrio'].notna() & comuna_valida),
+            'cargable': ~invalidas,
+        })
+        for columna in DIMENSIONES_OPCIONALES:
+            if columna in df:
+                texto = df[columna].astype(str).str.strip().where(df[columna].notna())
+                columnas[columna] = texto.mask(texto == '')
+        return pd.DataFrame(columnas, index=df.index), rechazados
+
+    @classmethod
+    def _resolver_obras(cls, normalizado):
+        """
+        Reemplaza los valores de las claves foráneas de _normalizar_obras por ids, creando las
+        filas de dimensión que falten, y retorna la tabla con solo las filas cargables.
+        """
+        tabla = normalizado.drop(columns='cargable')
+        etapas, tipos, areas = tabla['etapa'], tabla['tipo_obra'], tabla['area_responsable']
+
+        # Etapa, tipo y área se crean incluso si la fila se rechaza luego por la comuna,
+        # igual que en la carga fila por fila.
+        tabla['etapa'] = etapas.map(cls._resolver_dimension(Etapa, Etapa.nombre, etapas)).astype('Int64')
+        tabla['tipo_obra'] = tipos.map(cls._resolver_dimension(TipoObra, TipoObra.nombre, tipos)).astype('Int64')
+        tabla['area_responsable'] = areas.map(
+            cls._resolver_dimension(AreaResponsable, AreaResponsable.nombre, areas)).astype('Int64')
+
+        numeros = tabla['comuna']
+        tabla['comuna'] = numeros.map(cls._resolver_dimension(Comuna, Comuna.numero, numeros.dropna())).astype('Int64')
+
+        # Como en la carga fila por fila, estas solo se crean para las filas que se cargan
+        for campo, Modelo in DIMENSIONES_OPCIONALES.items():
+            if campo in tabla:
+                valores = tabla[campo]
+                ids = cls._resolver_dimension(Modelo, Modelo.nombre, valores[normalizado['cargable']].dropna())
+                tabla[campo] = valores.map(ids).astype('Int64')
+
+        claves_barrio = pd.DataFrame({'nombre': tabla['barrio'], 'comuna': tabla['comuna']})
+        tabla_barrios = cls._resolver_barrios(claves_barrio.dropna())
+        tabla['barrio'] = (claves_barrio.merge(tabla_barrios, how='left', on=['nombre', 'comuna'])['id']
+                                        .set_axis(tabla.index).astype('Int64'))
+        return tabla[normalizado['cargable']]
+
+    @classmethod
+    def _filas_sql(cls, tabla):
+        return list(zip(*(cls._a_valores_sql(tabla[columna]) for columna in tabla.columns)))
+
+    @classmethod
+    def _resolver_dimension(cls, Modelo, campo, valores, crear=True):
+        """
+        Retorna un dict valor -> id para los valores distintos dados, creando en un solo
+        insert_many los que no existan (en orden de aparición, como get_or_create).
+        Con crear=False los que no existen quedan fuera del dict.
+        Los valores ya presentes en cache_dimensiones no se consultan.
+        """
+        distintos = [v.item() if hasattr(v, 'item') else v for v in pd.unique(valores)]
+        ids = cache_dimensiones.buscar(Modelo, distintos)
+        pendientes = [v for v in distintos if v not in ids]
+        for lote in peewee.chunked(pendientes, 500):
+            existentes = dict(cls._consulta_dimension(Modelo, campo, lote).tuples())
+            cache_dimensiones.registrar(Modelo, existentes)
+            ids.update(existentes)
+        faltantes = [v for v in pendientes if v not in ids]
+        if faltantes and crear:
+            for lote in peewee.chunked(faltantes, 500):
+                Modelo.insert_many([(v,) for v in lote], fields=[campo]).execute()
+            for lote in peewee.chunked(faltantes, 500):
+                creados = dict(cls._consulta_dimension(Modelo, campo, lote).tuples())
+                # Dentro de una transacción quedan pendientes en la caché hasta que se confirme
+                cache_dimensiones.registrar(Modelo, creados)
+                ids.update(creados)
+        return ids
+
+    @classmethod
+    def _resolver_barrios(cls, claves):
+        """
+        Igual que _resolver_dimension pero para Barrio, cuya clave es (nombre, comuna).
+        Retorna un DataFrame con columnas nombre, comuna e id.
+        """
+        distintas = list(dict.fromkeys(zip(claves['nombre'].tolist(), claves['comuna'].tolist())))
+
+        def leer(claves_barrio):
+            # Por nombre, con el índice (nombre, comuna); la comuna se compara acá
+            leidos = {}
+            for lote in peewee.chunked(list(dict.fromkeys(nombre for nombre, _ in claves_barrio)), 500):
+                leidos.update(((nombre, comuna), pk) for nombre, comuna, pk in cls._consulta_barrios(lote).tuples())
+            return leidos
+
+        existentes = leer(distintas)
+        faltantes = [clave for clave in distintas if clave not in existentes]
+        for lote in peewee.chunked(faltantes, 500):
+            Barrio.insert_many(lote, fields=[Barrio.nombre, Barrio.comuna]).execute()
+        if faltantes:
+            existentes.update(leer(faltantes))
+        tabla = pd.DataFrame([(nombre, comuna, existentes[(nombre, comuna)]) for nombre, comuna in distintas],
+                             columns=['nombre', 'comuna', 'id'])
+        return tabla.astype({'comuna': 'Int64', 'id': 'Int64'})
+
+    @staticmethod
+    def _enteros_validos(serie):
+        # Equivalente vectorizado de "int(valor) no lanza excepción"
+        if pd.api.types.is_integer_dtype(serie):
+            return serie.notna()
+        if pd.api.types.is_numeric_dtype(serie):
+            return serie.notna() & (serie == np.floor(serie))
+        return serie.astype(str).str.strip().str.fullmatch(r'[+-]?\d+').fillna(False).astype(bool) & serie.notna()
+
+    @staticmethod
+    def _a_valores_sql(serie):
+        # Convierte a tipos nativos de Python con None en lugar de NaN; las fechas
+        # como texto ISO, igual que las guarda DateField
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            serie = serie.dt.strftime('%Y-%m-%d')
+        return serie.astype(object).where(serie.notna(), None).tolist()
+
+
+    @classmethod
+    @instrumentado
+    def sincronizar_datos(cls, df_limpio, marcar_removidas=False):
+        """
+        Sincronización incremental a partir de un DataFrame limpio: inserta las filas nuevas,
+        actualiza las que cambiaron y, si marcar_removidas es True, marca como removidas las
+        huellas que ya no aparecen: sus obras quedan en la base pero dejan de contarse en los
+        indicadores y las búsquedas (Obra.condicion_vigente). Si la fila vuelve a aparecer, la
+        obra se reactiva. Retorna un dict con los conteos, o False si falla.
+        """
+        return cls._sincronizar([df_limpio], marcar_removidas)
+
+    @classmethod
+    @instrumentado
+    def sincronizar_csv(cls, path_csv='observatorio-de-obras-urbanas.csv', delimiter=';', encoding=None,
+                        tamano_lote=10000, marcar_removidas=False):
+        """
+        Igual que sincronizar_datos pero leyendo el CSV por lotes con extraer_datos_por_lotes.
+        """
+        try:
+            # extraer_datos_por_lotes es perezoso: sin esta comprobación el archivo faltante
+            # recién se detectaría dentro de _sincronizar, como un error inesperado
+            os.stat(path_csv)
+            lotes = (cls.limpiar_datos(lote) for lote in
+                     cls.extraer_datos_por_lotes(path_csv, delimiter, encoding, tamano_lote))
+            return cls._sincronizar(lotes, marcar_removidas)
+        except FileNotFoundError:
+            reportes.error("ERROR: El archivo '%s' no fue encontrado. Asegúrate de que esté en la misma carpeta que el script.", path_csv)
             return False
 
-        print("Iniciando carga de datos a la base de datos...")
+    @classmethod
+    def _sincronizar(cls, lotes, marcar_removidas):
+        """
+        Cada fila se identifica con una clave estable (hash de COLUMNAS_CLAVE más el número
+        de ocurrencia, para filas repetidas) y un hash de su contenido, guardados en HuellaObra.
+        Solo se escriben las filas nuevas o cambiadas, en lotes y con una transacción por lote.
+        Si la base tiene obras pero ninguna huella, no se puede saber qué filas ya están
+        cargadas: no se sincroniza y se retorna False.
+        """
+        total = {'nuevas': 0, 'actualizadas': 0, 'sin_cambios': 0, 'removidas': 0, 'rechazadas': 0}
+        ocurrencias = {}
+        vistas = peewee.Table('huellas_vistas', ('clave',)).bind(db)
+        reportes.info("Iniciando sincronización incremental...")
         try:
-            with db.atomic():
-                for index, row in df_limpio.iterrows():
-                    campos_importantes = ['nombre', 'etapa', 'tipo', 'area_responsable']
-                    # Si falta algún campo importante, no lo cargues
-                    if any(pd.isna(row[campo]) for campo in campos_importantes if campo in row):
+            # La tabla temporal de huellas vistas vive en la conexión: se usa una sola
+            with conexion():
+                if not HuellaObra.select().exists() and Obra.select().exists():
+                    # Obras cargadas sin huellas (cargar_datos, procesar_csv_en_paralelo): todas las
+                    # filas del CSV parecerían nuevas y se insertarían otra vez
+                    reportes.error("ERROR: La base tiene obras cargadas sin huellas de sincronización; "
+                                   "sincronizar las duplicaría. Vuelva a cargarla en una base vacía con "
+                                   "sincronizar_csv (o 'cargar' sin --procesos).")
+                    return False
+                if marcar_removidas:
+                    db.execute_sql('CREATE TEMP TABLE IF NOT EXISTS huellas_vistas (clave INTEGER PRIMARY KEY)')
+                    db.execute_sql('DELETE FROM huellas_vistas')
+                for df_limpio in lotes:
+                    if df_limpio is None or df_limpio.empty:
                         continue
+                    claves, hashes = cls._huellas(df_limpio, ocurrencias)
+                    with db.atomic():
+                        reporte = cls._sincronizar_lote(df_limpio, claves, hashes)
+                        if marcar_removidas:
+                            for lote in peewee.chunked(claves.tolist(), 500):
+                                vistas.insert([(clave,) for clave in lote], columns=[vistas.clave]).on_conflict_ignore().execute()
+                    for clave, cantidad in reporte.items():
+                        total[clave] += cantidad
 
-                    try:
-                        etapa_obj, _ = Etapa.get_or_create(nombre=str(row['etapa']).strip() if pd.notna(row['etapa']) else None)
-                        tipo_obra_obj, _ = TipoObra.get_or_create(nombre=str(row['tipo']).strip() if pd.notna(row['tipo']) else None)
-                        area_responsable_obj, _ = AreaResponsable.get_or_create(nombre=str(row['area_responsable']).strip() if pd.notna(row['area_responsable']) else None)
-                        comuna_obj = None
-                        if pd.notna(row['comuna']):
-                            comuna_obj, _ = Comuna.get_or_create(numero=int(row['comuna']))
-                        barrio_obj = None
-                        if pd.notna(row['barrio']) and comuna_obj:
-                            barrio_obj, _ = Barrio.get_or_create(nombre=str(row['barrio']).strip(), comuna=comuna_obj)
-
-                        Obra.create(
-                            nombre=row['nombre'] if pd.notna(row['nombre']) else "Obra sin nombre",
-                            descripcion=row['descripcion'] if pd.notna(row['descripcion']) else None,
-                            monto_contrato=row['monto_contrato'] if pd.notna(row['monto_contrato']) else None,
-                            tipo_obra=tipo_obra_obj,
-                            area_responsable=area_responsable_obj,
-                            etapa=etapa_obj,
-                            comuna=comuna_obj,
-                            barrio=barrio_obj
-                        )
-                        print(f"Registro {index} cargado correctamente.")
-                    except Exception as e:
-                        print(f"Error al cargar el registro {index}: {e}")
-            print("Carga finalizada.")
-            return True
+                if marcar_removidas:
+                    with db.atomic():
+                        total['removidas'] = (HuellaObra.update(removida=True)
+                                                        .where((HuellaObra.removida == False) &
+                                                               HuellaObra.clave.not_in(vistas.select(vistas.clave)))
+                                                        .execute())
+                    db.execute_sql('DROP TABLE IF EXISTS huellas_vistas')
+
+            estadisticas.agregar_filas(total['nuevas'] + total['actualizadas'] + total['sin_cambios'] + total['rechazadas'])
+            reportes.info("Sincronización finalizada: %s nuevas, %s actualizadas, %s sin cambios, %s removidas, %s rechazadas.",
+                          total['nuevas'], total['actualizadas'], total['sin_cambios'], total['removidas'], total['rechazadas'])
+            return total
+        except OperationalError as e:
+            reportes.error("ERROR en la operación de base de datos durante la sincronización: %s", e)
+            return False
         except Exception as e:
-            print(f"ERROR inesperado durante la carga de datos: {e}")
+            reportes.error("ERROR inesperado durante la sincronización: %s", e)
             return False
-        finally:
-            if not db.is_closed():
-                db.close()
-                print("Conexión a la base de datos cerrada.")
 
+    @classmethod
+    def _sincronizar_lote(cls, df_limpio, claves, hashes, tamano_lote=500):
+        existentes = []
+        for lote in peewee.chunked(pd.unique(claves).tolist(), 500):
+            existentes.extend(cls._consulta_huellas(lote).tuples())
+        existentes = (pd.DataFrame(existentes, columns=['clave', 'hash', 'obra_id', 'removida'])
+                        .astype({'hash': 'Int64', 'obra_id': 'Int64'}).set_index('clave'))
+
+        hash_previo = claves.map(existentes['hash'])
+        obra_previa = claves.map(existentes['obra_id'])
+        removida = claves.map(existentes['removida']).fillna(False).astype(bool)
+        nuevas = hash_previo.isna() | obra_previa.isna()
+        cambiadas = ~nuevas & (hash_previo != hashes)
+        reactivadas = ~nuevas & ~cambiadas & removida
+
+        reporte = {'nuevas': 0, 'actualizadas': 0, 'sin_cambios': int((~nuevas & ~cambiadas).sum()), 'rechazadas': 0}
+        obra_ids = obra_previa.copy()
+
+        if nuevas.any():
+            tabla, rechazadas = cls._preparar_obras(df_limpio[nuevas])
+            campos = [getattr(Obra, campo) for campo in tabla.columns]
+            # Sin AUTOINCREMENT, SQLite asigna max(id) + 1 en orden dentro de la transacción
+            inicio = (cls._consulta_ultimo_id().scalar() or 0) + 1
+            with indexacion_diferida():
+                cls._insertar_filas(Obra, campos, cls._filas_sql(tabla), tamano_lote)
+            obra_ids.loc[tabla.index] = np.arange(inicio, inicio + len(tabla))
+            reporte['nuevas'] = len(tabla)
+            reporte['rechazadas'] += rechazadas
+
+        if cambiadas.any():
+            tabla, rechazadas = cls._preparar_obras(df_limpio[cambiadas])
+            tabla.insert(0, 'id', obra_previa[tabla.index])
+            campos = [getattr(Obra, campo) for campo in tabla.columns]
+            cls._insertar_filas(Obra, campos, cls._filas_sql(tabla), tamano_lote,
+                                conflict_target=[Obra.id], preserve=campos[1:])
+            reporte['actualizadas'] = len(tabla)
+            reporte['rechazadas'] += rechazadas
+
+        escribir = (nuevas | cambiadas | reactivadas) & obra_ids.notna()
+        huellas = pd.DataFrame({'clave': claves, 'hash': hashes, 'obra': obra_ids, 'removida': False})[escribir]
+        campos_huella = [HuellaObra.clave, HuellaObra.hash_contenido, HuellaObra.obra, HuellaObra.removida]
+        cls._insertar_filas(HuellaObra, campos_huella, cls._filas_sql(huellas), tamano_lote,
+                            conflict_target=[HuellaObra.clave], preserve=campos_huella[1:])
+        return reporte
+
+    @staticmethod
+    def _huellas(df_limpio, ocurrencias):
+        """
+        Retorna (claves, hashes) como Series int64: la clave estable de cada fila y el hash
+        de su contenido. ocurrencias acumula cuántas veces apareció cada clave base en lotes
+        anteriores, para que las filas repetidas tengan claves distintas y estables.
+        """
+        columnas_clave = [columna for columna in COLUMNAS_CLAVE if columna in df_limpio]
+        base = GestionarObra._como_texto(df_limpio[columnas_clave]).apply(lambda serie: serie.str.strip().str.lower())
+        clave_base = pd.Series(pd.util.hash_pandas_object(base, index=False).to_numpy().view('int64'),
+                               index=df_limpio.index)
+        conteo = clave_base.value_counts()
+        previas = pd.Series([ocurrencias.get(clave, 0) for clave in conteo.index.tolist()], index=conteo.index)
+        numero = clave_base.map(previas) + clave_base.groupby(clave_base).cumcount()
+        ocurrencias.update((previas + conteo).to_dict())
+        claves = pd.util.hash_pandas_object(pd.DataFrame({'clave': clave_base, 'numero': numero}), index=False)
+
+        columnas_contenido = [columna for columna in COLUMNAS_OBRA if columna in df_limpio]
+        hashes = pd.util.hash_pandas_object(GestionarObra._como_texto(df_limpio[columnas_contenido]), index=False)
+        return (pd.Series(claves.to_numpy().view('int64'), index=df_limpio.index),
+                pd.Series(hashes.to_numpy().view('int64'), index=df_limpio.index))
 
     @classmethod
     def nueva_obra(cls):
@@ -170,75 +991,401 @@ class GestionarObra(ABC):
             return None
 
     @classmethod
-    def obtener_indicadores(cls):
+    @instrumentado
+    def crear_obras(cls, especificaciones, delimiter=',', encoding='utf-8-sig', tamano_lote=500):
         """
-        g. Obtiene y muestra por consola la información de las obras existentes.
-        Utiliza sentencias ORM para las consultas.
+        Alta no interactiva de muchas obras, todas en la etapa "Proyecto".
+        especificaciones es una lista de dicts, un DataFrame o la ruta a un archivo .json (una
+        lista de objetos) o .csv, con los campos de CAMPOS_NUEVA_OBRA: tipo_obra y
+        area_responsable por nombre, comuna por número y barrio por nombre dentro de esa
+        comuna. Como en nueva_obra, las cuatro son obligatorias y tienen que existir; se
+        resuelven con una consulta por tabla en lugar de una por obra.
+
+        Las obras válidas se insertan en bloque en una sola transacción y las demás se
+        informan sin interrumpir la carga. Retorna un dict posición -> {'estado' ('creada' o
+        'error'), 'id', 'detalle'}, o None si no se pudo leer el origen o falla la base.
         """
-        print("\n--- Indicadores de Obras Urbanas ---")
         try:
-            print("\n1. Áreas Responsables:")
-            areas = AreaResponsable.select().order_by(AreaResponsable.nombre)
-            for area in areas:
-                print(f"- {area.nombre}")
-
-            print("\n2. Tipos de Obra:")
-            tipos = TipoObra.select().order_by(TipoObra.nombre)
-            for tipo in tipos:
-                print(f"- {tipo.nombre}")
-
-            print("\n3. Cantidad de obras por etapa:")
-            obras_por_etapa = (Obra.select(Obra.etapa.nombre, fn.COUNT(Obra.id).alias('cantidad'))
-                                    .join(Etapa)
-                                    .group_by(Obra.etapa.nombre)
-                                    .order_by(fn.COUNT(Obra.id).desc()))
-            for res in obras_por_etapa:
-                print(f"- {res.etapa.nombre}: {res.cantidad} obras")
-
-            print("\n4. Obras y Monto de Inversión por Tipo de Obra:")
-            inversion_por_tipo = (Obra.select(Obra.tipo_obra.nombre,
-                                            fn.COUNT(Obra.id).alias('cantidad'),
-                                            fn.SUM(Obra.monto_contrato).alias('monto_total'))
-                                        .join(TipoObra)
-                                        .group_by(Obra.tipo_obra.nombre)
-                                        .order_by(peewee.fn.COUNT(Obra.id).desc()))
-            for res in inversion_por_tipo:
-                monto_total = f"${res.monto_total:,.2f}" if res.monto_total else "N/A"
-                print(f"- {res.tipo_obra.nombre}: {res.cantidad} obras, Inversión total: {monto_total}")
-
-            print("\n5. Barrios en Comunas 1, 2 y 3:")
-            barrios_en_comunas = (Barrio.select(Barrio.nombre, Barrio.comuna.numero)
-                                        .join(Comuna)
-                                        .where(Comuna.numero.in_([1, 2, 3]))
-                                        .order_by(Comuna.numero, Barrio.nombre))
-            if not barrios_en_comunas.exists():
-                print("   No se encontraron barrios para las comunas 1, 2 y 3. Asegúrate de que las comunas y barrios estén cargados.")
+            df = cls._leer_especificaciones(especificaciones, delimiter, encoding)
+        except (OSError, ValueError) as e:
+            reportes.error("ERROR al leer las obras a crear: %s", e)
+            return None
+        desconocidas = [columna for columna in df.columns if columna not in CAMPOS_NUEVA_OBRA]
+        if desconocidas:
+            reportes.warning("Se ignoran los campos desconocidos: %s", ", ".join(map(str, desconocidas)))
+        df = df.reindex(columns=CAMPOS_NUEVA_OBRA)
+
+        try:
+            with conexion(), db.atomic():
+                tabla, errores = cls._validar_obras_nuevas(df)
+                validas = tabla[~tabla.index.isin(list(errores))]
+                validas = validas.assign(etapa=cache_dimensiones.obtener_id(Etapa, "Proyecto"))
+                # Las obras nuevas reciben ids consecutivos desde el máximo actual (un único escritor)
+                ultimo_id = cls._consulta_ultimo_id().scalar() or 0
+                with indexacion_diferida():
+                    cls._insertar_filas(Obra, [getattr(Obra, campo) for campo in validas.columns],
+                                        cls._filas_sql(validas), tamano_lote)
+        except OperationalError as e:
+            reportes.error("ERROR en la operación de base de datos al crear obras: %s", e)
+            return None
+        except Exception as e:
+            reportes.error("ERROR inesperado al crear obras: %s", e)
+            return None
+
+        reporte = {}
+        for id_obra, posicion in enumerate(validas.index, start=ultimo_id + 1):
+            reporte[posicion] = {'estado': 'creada', 'id': id_obra, 'detalle': None}
+        for posicion, mensajes in sorted(errores.items()):
+            reporte[posicion] = {'estado': 'error', 'id': None, 'detalle': "; ".join(mensajes)}
+            reportes.warning("Obra %s no creada: %s", posicion, reporte[posicion]['detalle'])
+        reporte = dict(sorted(reporte.items()))
+        estadisticas.agregar_filas(len(df))
+        reportes.info("Obras creadas en etapa 'Proyecto': %s; con errores: %s.", len(validas), len(errores))
+        return reporte
+
+    @staticmethod
+    def _leer_especificaciones(especificaciones, delimiter, encoding):
+        # Retorna un DataFrame con una fila por obra, indexado por posición
+        if isinstance(especificaciones, pd.DataFrame):
+            df = especificaciones
+        elif isinstance(especificaciones, (str, os.PathLike)):
+            path = os.fspath(especificaciones)
+            if path.lower().endswith('.json'):
+                with open(path, encoding=encoding) as archivo:
+                    registros = json.load(archivo)
+                if not isinstance(registros, list):
+                    raise ValueError(f"'{path}' debe contener una lista de obras.")
+                df = pd.DataFrame.from_records(registros)
             else:
-                current_comuna = None
-                for barrio in barrios_en_comunas:
-                    if barrio.comuna.numero != current_comuna:
-                        print(f"\n  Comuna {barrio.comuna.numero}:")
-                        current_comuna = barrio.comuna.numero
-                    print(f"   - {barrio.nombre}")
-
-            print("\n6. Cantidad de obras finalizadas en <= 24 meses:")
-            obras_finalizadas_en_plazo = (Obra.select()
-                                        .join(Etapa)
-                                        .where(
-                                            (Etapa.nombre == "Finalizada") &
-                                            (Obra.plazo_meses <= 24)
-                                        ).count())
-            print(f"- {obras_finalizadas_en_plazo} obras finalizadas en 24 meses o menos.")
-
-            print("\n7. Monto total de inversión:")
-            monto_total_general = Obra.select(fn.SUM(Obra.monto_contrato)).scalar()
-            monto_total_general_formato = f"${monto_total_general:,.2f}" if monto_total_general else "N/A"
-            print(f"- El monto total de inversión de todas las obras es: {monto_total_general_formato}")
+                df = pd.read_csv(path, sep=delimiter, encoding=encoding, dtype=str, keep_default_na=False)
+        else:
+            df = pd.DataFrame.from_records(list(especificaciones))
+        return df.reset_index(drop=True)
+
+    @classmethod
+    def _validar_obras_nuevas(cls, df):
+        """
+        Valida y convierte las especificaciones de crear_obras. Retorna (tabla, errores), con
+        tabla lista para insertar (claves foráneas como ids) y errores un dict
+        posición -> lista de mensajes para las filas que no se pueden crear.
+        """
+        errores = {}
+
+        def rechazar(mascara, mensaje):
+            for posicion in df.index[mascara]:
+                errores.setdefault(posicion, []).append(mensaje(posicion))
+
+        tabla = pd.DataFrame(index=df.index)
+        for campo in ['nombre', 'descripcion', 'direccion', 'tipo_obra', 'area_responsable', 'barrio']:
+            texto = cls._como_texto(df[campo]).str.strip()
+            tabla[campo] = texto.where(texto != '')
+        rechazar(tabla['nombre'].isna(), lambda _: "falta el nombre")
+
+        tabla['monto_contrato'], invalidos = cls._a_numero(df['monto_contrato'], minimo=0)
+        rechazar(invalidos, lambda i: f"monto_contrato inválido: {df.at[i, 'monto_contrato']!r}")
+        for campo, limite in [('lat', 90), ('lng', 180)]:
+            tabla[campo], invalidos = cls._a_numero(df[campo], minimo=-limite, maximo=limite)
+            rechazar(invalidos, lambda i, campo=campo: f"{campo} inválida: {df.at[i, campo]!r}")
+        rechazar(tabla['lat'].isna() != tabla['lng'].isna(), lambda _: "lat y lng van juntas")
+
+        for campo, Modelo in [('tipo_obra', TipoObra), ('area_responsable', AreaResponsable)]:
+            valores = tabla[campo]
+            ids = cls._resolver_dimension(Modelo, Modelo.nombre, valores.dropna(), crear=False)
+            tabla[campo] = valores.map(ids).astype('Int64')
+            rechazar(valores.isna(), lambda _, campo=campo: f"falta {campo}")
+            rechazar(valores.notna() & tabla[campo].isna(),
+                     lambda i, campo=campo, valores=valores: f"{campo} '{valores[i]}' no existe")
+
+        numeros, invalidos = cls._a_numero(df['comuna'])
+        invalidos |= numeros.notna() & (numeros != np.floor(numeros))
+        numeros = numeros.mask(invalidos).astype('Int64')
+        tabla['comuna'] = numeros.map(
+            cls._resolver_dimension(Comuna, Comuna.numero, numeros.dropna(), crear=False)).astype('Int64')
+        rechazar(invalidos, lambda i: f"comuna inválida: {df.at[i, 'comuna']!r}")
+        rechazar(df['comuna'].isna() | df['comuna'].astype('str').str.strip().eq(''), lambda _: "falta comuna")
+        rechazar(numeros.notna() & tabla['comuna'].isna(), lambda i: f"comuna {numeros[i]} no existe")
+
+        nombres = tabla['barrio']
+        barrios = {(nombre, comuna): pk for lote in peewee.chunked(nombres.dropna().unique().tolist(), 500)
+                   for nombre, comuna, pk in Barrio.select(Barrio.nombre, Barrio.comuna, Barrio.id)
+                                                   .where(Barrio.nombre.in_(lote)).tuples()}
+        tabla['barrio'] = pd.Series([barrios.get((nombre, comuna)) for nombre, comuna in
+                                     zip(nombres.tolist(), tabla['comuna'].astype(object).tolist())],
+                                    index=tabla.index, dtype='Int64')
+        rechazar(nombres.isna(), lambda _: "falta barrio")
+        rechazar(nombres.notna() & tabla['comuna'].notna() & tabla['barrio'].isna(),
+                 lambda i: f"barrio '{nombres[i]}' no existe en la comuna {numeros[i]}")
+        return tabla, errores
+
+    @classmethod
+    @instrumentado
+    def aplicar_transiciones(cls, transiciones):
+        """
+        Aplica en una sola transacción una lista de transiciones del ciclo de vida, cada una
+        como (obra_id, operacion) o (obra_id, operacion, args), donde operacion es el nombre
+        de un método de Obra (p. ej. 'aumentar_plazo') y args una tupla con sus argumentos.
+
+        Las transiciones de una misma obra se aplican en orden; las operaciones iguales con
+        los mismos argumentos se agrupan en un único UPDATE ... WHERE id IN (...).
+        Si alguna transición de una obra es inválida (también si no tiene esa forma), no se
+        aplica ninguna de esa obra.
+        Retorna un dict obra_id -> {'estado', 'operaciones', 'detalle'}, o None si falla. Un
+        obra_id no hasheable figura en el reporte por su repr.
+        """
+        por_obra = {}
+        errores = {}
+        for transicion in transiciones:
+            obra_id, paso, error = cls._leer_transicion(transicion)
+            por_obra.setdefault(obra_id, [])
+            if error:
+                errores.setdefault(obra_id, error)
+            else:
+                por_obra[obra_id].append(paso)
+
+        reporte = {obra_id: {'estado': 'aplicada', 'operaciones': [op for op, _ in pasos], 'detalle': None}
+                   for obra_id, pasos in por_obra.items()}
+        for obra_id, error in errores.items():
+            reporte[obra_id].update(estado='error', operaciones=[], detalle=error)
+        try:
+            with conexion(), db.atomic():
+                existentes = set()
+                for lote in peewee.chunked([obra_id for obra_id in por_obra if obra_id not in errores], 500):
+                    existentes.update(pk for (pk,) in cls._consulta_obras_por_id(lote).tuples())
+
+                # Ronda k: k-ésima transición de cada obra. Dentro de una ronda las obras son
+                # independientes y se agrupan por (operación, argumentos).
+                # Cada (operación, argumentos) distinta se resuelve una sola vez, no una por obra
+                resueltos = {}
+
+                def cambio_de(op, args):
+                    clave = cls._clave_transicion(op, args)
+                    if clave not in resueltos:
+                        resueltos[clave] = Obra.cambios_transicion(op, *args)
+                    return resueltos[clave]
+
+                rondas = []
+                for obra_id, pasos in por_obra.items():
+                    if obra_id in errores:
+                        continue
+                    if obra_id not in existentes:
+                        reporte[obra_id].update(estado='no encontrada', operaciones=[])
+                        continue
+                    try:
+                        cambios = [cambio_de(op, args) for op, args in pasos]
+                    except ValueError as e:
+                        reporte[obra_id].update(estado='error', operaciones=[], detalle=str(e))
+                        continue
+                    for k, ((op, args), cambio) in enumerate(zip(pasos, cambios)):
+                        if k == len(rondas):
+                            rondas.append({})
+                        grupo = rondas[k].setdefault(cls._clave_transicion(op, args), (cambio, []))
+                        grupo[1].append(obra_id)
+
+                for ronda in rondas:
+                    for cambio, ids in ronda.values():
+                        for lote in peewee.chunked(ids, 500):
+                            Obra.update(cambio).where(Obra.id.in_(lote)).execute()
+
+            aplicadas = sum(1 for r in reporte.values() if r['estado'] == 'aplicada')
+            estadisticas.agregar_filas(len(reporte))
+            reportes.info("Transiciones aplicadas: %s obras actualizadas, %s con errores.", aplicadas, len(reporte) - aplicadas)
+            return reporte
+        except OperationalError as e:
+            reportes.error("ERROR en la operación de base de datos al aplicar transiciones: %s", e)
+            return None
+        except Exception as e:
+            reportes.error("ERROR inesperado al aplicar transiciones: %s", e)
+            return None
+
+    @staticmethod
+    def _clave_transicion(op, args):
+        # Clave de agrupación; con valores no hasheables (p. ej. listas) se usa su repr
+        try:
+            hash((op, args))
+            return (op, args)
+        except TypeError:
+            return (repr(op), repr(args))
 
+    @staticmethod
+    def _leer_transicion(transicion):
+        # (obra_id, (operacion, args), error) de una transición (obra_id, operacion[, args]);
+        # error es None si tiene esa forma
+        if not isinstance(transicion, (tuple, list)) or not transicion:
+            return repr(transicion), None, f"Transición inválida: {transicion!r}"
+        obra_id = transicion[0]
+        try:
+            hash(obra_id)
+        except TypeError:
+            return repr(obra_id), None, f"Id de obra inválido: {obra_id!r}"
+        if len(transicion) not in (2, 3):
+            return obra_id, None, f"Transición inválida: {transicion!r}"
+        operacion, args = (tuple(transicion[1:]) + ((),))[:2]
+        if not isinstance(args, (tuple, list)):
+            return obra_id, None, f"Los argumentos de '{operacion}' deben ir en una tupla: {args!r}"
+        return obra_id, (operacion, tuple(args)), None
+
+    @classmethod
+    @instrumentado
+    def obtener_indicadores(cls, mostrar=True):
+        """
+        g. Obtiene y muestra por consola la información de las obras existentes.
+        Utiliza sentencias ORM para las consultas (ver indicadores.MotorIndicadores).
+        Retorna un objeto Indicadores; mientras los datos no cambian se sirve desde memoria.
+        """
+        try:
+            with conexion():
+                indicadores = motor_indicadores.obtener()
+            if mostrar:
+                indicadores.mostrar()
+            return indicadores
         except OperationalError as e:
-            print(f"ERROR en la operación de base de datos al obtener indicadores: {e}")
+            reportes.error("ERROR en la operación de base de datos al obtener indicadores: %s", e)
+            return None
         except Exception as e:
-            print(f"ERROR inesperado al obtener indicadores: {e}")
+            reportes.error("ERROR inesperado al obtener indicadores: %s", e)
+            return None
+
+    @classmethod
+    def obtener_estadisticas(cls, mostrar=True):
+        """
+        Retorna las métricas acumuladas por sitio de llamada (llamadas, segundos, filas por
+        segundo, consultas SQL y su latencia); ver instrumentacion.Estadisticas.
+        """
+        if mostrar:
+            estadisticas.mostrar()
+        return estadisticas.resumen()
+
+    @classmethod
+    @instrumentado
+    def buscar_en_rectangulo(cls, lat_min, lng_min, lat_max, lng_max, etapa=None, comuna=None):
+        """
+        Retorna las obras cuyas coordenadas caen dentro del rectángulo, usando el índice
+        espacial. etapa (nombre) y comuna (número) filtran opcionalmente el resultado.
+        Retorna None si la consulta falla.
+        """
+        try:
+            with conexion():
+                return busquedas.obras_en_rectangulo(lat_min, lng_min, lat_max, lng_max, etapa, comuna)
+        except OperationalError as e:
+            reportes.error("ERROR en la operación de base de datos en la búsqueda espacial: %s", e)
+            return None
+
+    @classmethod
+    @instrumentado
+    def buscar_en_radio(cls, lat, lng, radio_metros, etapa=None, comuna=None):
+        """
+        Retorna una lista de (obra, distancia en metros) con las obras a menos de radio_metros
+        del punto, de la más cercana a la más lejana (ver busquedas.obras_en_radio).
+        Retorna None si la consulta falla.
+        """
+        try:
+            with conexion():
+                return busquedas.obras_en_radio(lat, lng, radio_metros, etapa, comuna)
+        except OperationalError as e:
+            reportes.error("ERROR en la operación de base de datos en la búsqueda espacial: %s", e)
+            return None
+
+    @classmethod
+    @instrumentado
+    def obras_cercanas(cls, lat, lng, k=10, etapa=None, comuna=None, radio_inicial=500):
+        """
+        Retorna las k obras más cercanas al punto como lista de (obra, distancia en metros)
+        (ver busquedas.obras_cercanas). Retorna None si la consulta falla.
+        """
+        try:
+            with conexion():
+                return busquedas.obras_cercanas(lat, lng, k, etapa, comuna, radio_inicial)
+        except OperationalError as e:
+            reportes.error("ERROR en la operación de base de datos en la búsqueda espacial: %s", e)
+            return None
+
+    @classmethod
+    @instrumentado
+    def buscar_texto(cls, texto, limite=20, etapa=None, comuna=None):
+        """
+        Busca obras por palabras de su nombre o descripción con el índice de texto completo.
+        Deben aparecer todas las palabras; no distingue mayúsculas ni acentos y una palabra
+        terminada en * busca por prefijo ("hosp*"). Retorna una lista de (obra, relevancia)
+        de la más a la menos relevante, como mucho limite, o None si la consulta falla.
+        """
+        try:
+            with conexion():
+                return busquedas.buscar_texto(texto, limite, etapa, comuna)
+        except OperationalError as e:
+            reportes.error("ERROR en la operación de base de datos en la búsqueda de texto: %s", e)
+            return None
+
+    @classmethod
+    def _consultas_carga(cls):
+        # Las mismas consultas que arman la carga, la sincronización, las transiciones y las
+        # búsquedas (con sus funciones), con valores de ejemplo
+        return {
+            'dimension_por_nombre': cls._consulta_dimension(Etapa, Etapa.nombre, ['Finalizada']),
+            'barrios_por_nombre': cls._consulta_barrios(['Palermo', 'Recoleta']),
+            'obras_por_id': cls._consulta_obras_por_id([1, 2, 3]),
+            'ultimo_id_obra': cls._consulta_ultimo_id(),
+            'huellas_por_clave': cls._consulta_huellas([1, 2, 3]),
+            'obras_en_rectangulo': busquedas.filtrar_obras(Obra.en_rectangulo(-34.61, -58.39, -34.60, -58.37),
+                                                           'Finalizada', 14),
+            'obras_por_texto': busquedas.filtrar_obras(Obra.buscar_texto(busquedas.consulta_fts('escuela')),
+                                                       'Finalizada', 14).limit(20),
+        }
+
+    @staticmethod
+    def _consulta_dimension(Modelo, campo, valores):
+        return Modelo.select(campo, Modelo.id).where(campo.in_(valores))
+
+    @staticmethod
+    def _consulta_barrios(nombres):
+        return Barrio.select(Barrio.nombre, Barrio.comuna, Barrio.id).where(Barrio.nombre.in_(nombres))
+
+    @staticmethod
+    def _consulta_obras_por_id(ids):
+        return Obra.select(Obra.id).where(Obra.id.in_(ids))
+
+    @staticmethod
+    def _consulta_ultimo_id():
+        return Obra.select(fn.MAX(Obra.id))
+
+    @staticmethod
+    def _consulta_huellas(claves):
+        # La obra sale del LEFT JOIN y no de la columna de la huella: una obra borrada en
+        # una base sin foreign_keys deja la huella apuntando a un id que ya no existe
+        return (HuellaObra.select(HuellaObra.clave, HuellaObra.hash_contenido, Obra.id, HuellaObra.removida)
+                          .join(Obra, peewee.JOIN.LEFT_OUTER, on=(HuellaObra.obra == Obra.id))
+                          .where(HuellaObra.clave.in_(claves)))
+
+    # Consultas que listan o agregan tablas completas: el escaneo es lo esperado.
+    _ESCANEOS_ESPERADOS = {'dimensiones', 'agregados_obras'}
+
+    @classmethod
+    def verificar_planes_consulta(cls):
+        """
+        Ejecuta EXPLAIN QUERY PLAN sobre las consultas que emite GestionarObra y marca las
+        que recorren una tabla o un índice completos (SCAN) sin que sea lo esperado.
+        Retorna una lista de dicts {'consulta', 'plan', 'escaneos', 'alerta'}, o None si falla.
+        """
+        print("\n--- Verificación de planes de consulta ---")
+        try:
+            with conexion():
+                consultas = {**motor_indicadores.consultas(), **cls._consultas_carga()}
+                resultados = []
+                for nombre, consulta in consultas.items():
+                    sql, params = consulta.sql()
+                    plan = [fila[-1] for fila in db.execute_sql('EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+                    # Un SCAN recorre la tabla o el índice completo, también con USING [COVERING] INDEX;
+                    # los de tablas virtuales (FTS5, rtree) usan su propio índice
+                    escaneos = [paso for paso in plan if paso.startswith('SCAN') and 'VIRTUAL TABLE' not in paso]
+                    alerta = bool(escaneos) and nombre not in cls._ESCANEOS_ESPERADOS
+                    resultados.append({'consulta': nombre, 'plan': plan, 'escaneos': escaneos, 'alerta': alerta})
+                    estado = "ALERTA: escaneo completo" if alerta else "ok"
+                    print(f"- {nombre}: {estado}")
+                    for paso in plan:
+                        print(f"    {paso}")
+            return resultados
+        except OperationalError as e:
+            reportes.error("ERROR en la operación de base de datos al verificar planes de consulta: %s", e)
+            return None
 
     @classmethod
     def _solicitar_fk_existente(cls, Modelo, campo, texto):
@@ -254,4 +1401,36 @@ class GestionarObra(ABC):
             try:
                 return Modelo.get(getattr(Modelo, campo) == valor)
             except Modelo.DoesNotExist:
-                print(f"{texto} '{valor}' no existe. Intente nuevamente.\n")
\ No newline at end of file
+                print(f"{texto} '{valor}' no existe. Intente nuevamente.\n")
+
+
+def _primer_fin_de_registro(datos):
+    # Posición del primer salto de línea fuera de comillas, o -1
+    posicion = datos.find(b'\n')
+    while posicion >= 0 and datos.count(b'"', 0, posicion) % 2:
+        posicion = datos.find(b'\n', posicion + 1)
+    return posicion
+
+
+def _ultimo_fin_de_registro(datos):
+    # Posición del último salto de línea fuera de comillas, o -1; datos empieza en un registro
+    comillas = datos.count(b'"')
+    posicion = datos.rfind(b'\n')
+    while posicion >= 0 and (comillas - datos.count(b'"', posicion)) % 2:
+        posicion = datos.rfind(b'\n', 0, posicion)
+    return posicion
+
+
+def _limpiar_fragmento(encabezado, fragmento, delimiter, encoding):
+    """
+    Tarea de los procesos de GestionarObra.procesar_csv_en_paralelo: lee, limpia y normaliza un
+    fragmento del CSV sin tocar la base. Retorna (normalizado, rechazados, descartados en la
+    limpieza, rechazos de limpieza, filas leídas).
+    """
+    columnas = set(COLUMNAS_OBRA)
+    # Como en extraer_datos_por_lotes: todo como texto, para no depender de qué filas tiene el fragmento
+    lote = pd.read_csv(io.BytesIO(encabezado + fragmento), sep=delimiter, encoding=encoding, dtype=str,
+                       usecols=lambda columna: columna in columnas)
+    lote_limpio = GestionarObra.limpiar_datos(lote)
+    normalizado, rechazados = GestionarObra._normalizar_obras(lote_limpio)
+    return normalizado, rechazados, len(lote) - len(lote_limpio), GestionarObra._dataframe_rechazos, len(lote)
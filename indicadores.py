@@ -0,0 +1,186 @@
+# indicadores.py
+# Motor de indicadores de obras: calcula todas las métricas con dos consultas y cachea
+# el resultado hasta que cambian los datos. Solo depende de peewee y modelo_orm2.
+from dataclasses import dataclass
+import sqlite3
+import threading
+
+from peewee import fn, Value
+
+from modelo_orm2 import db, Etapa, TipoObra, AreaResponsable, Comuna, Barrio, Obra, registro_cambios
+
+
+@dataclass(frozen=True)
+class Indicadores:
+    areas: list                 # nombres de áreas responsables, ordenados
+    tipos: list                 # nombres de tipos de obra, ordenados
+    obras_por_etapa: list       # [(etapa, cantidad)] de mayor a menor
+    inversion_por_tipo: list    # [(tipo, cantidad, monto_total o None)] de mayor a menor cantidad
+    barrios_por_comuna: dict    # {numero de comuna: [barrios]} para las comunas 1, 2 y 3
+    finalizadas_en_plazo: int   # obras finalizadas con plazo <= 24 meses
+    monto_total: float          # suma de monto_contrato de todas las obras, o None
+    version: tuple
+
+    def mostrar(self):
+        print("\n--- Indicadores de Obras Urbanas ---")
+        print("\n1. Áreas Responsables:")
+        for area in self.areas:
+            print(f"- {area}")
+
+        print("\n2. Tipos de Obra:")
+        for tipo in self.tipos:
+            print(f"- {tipo}")
+
+        print("\n3. Cantidad de obras por etapa:")
+        for etapa, cantidad in self.obras_por_etapa:
+            print(f"- {etapa}: {cantidad} obras")
+
+        print("\n4. Obras y Monto de Inversión por Tipo de Obra:")
+        for tipo, cantidad, monto in self.inversion_por_tipo:
+            monto_total = f"${monto:,.2f}" if monto else "N/A"
+            print(f"- {tipo}: {cantidad} obras, Inversión total: {monto_total}")
+
+        print("\n5. Barrios en Comunas 1, 2 y 3:")
+        if not self.barrios_por_comuna:
+            print("   No se encontraron barrios para las comunas 1, 2 y 3. Asegúrate de que las comunas y barrios estén cargados.")
+        for numero, barrios in self.barrios_por_comuna.items():
+            print(f"\n  Comuna {numero}:")
+            for barrio in barrios:
+                print(f"   - {barrio}")
+
+        print("\n6. Cantidad de obras finalizadas en <= 24 meses:")
+        print(f"- {self.finalizadas_en_plazo} obras finalizadas en 24 meses o menos.")
+
+        print("\n7. Monto total de inversión:")
+        monto_total_general = f"${self.monto_total:,.2f}" if self.monto_total else "N/A"
+        print(f"- El monto total de inversión de todas las obras es: {monto_total_general}")
+
+
+class MotorIndicadores:
+    """
+    Calcula Indicadores con una consulta sobre las tablas de dimensión (UNION ALL) y una
+    única pasada agregada sobre obras, sin accesos perezosos a claves foráneas.
+    El resultado se cachea con la versión de los datos: máximo id de obras, escrituras
+    hechas desde este proceso (registro_cambios) y PRAGMA data_version, que cambia
+    cuando otra conexión confirma cambios. data_version solo es comparable dentro de una
+    misma conexión, así que se lee siempre de una conexión propia del motor, abierta
+    mientras dure el proceso (y reabierta si configurar_db cambia de archivo).
+    Las obras marcadas como removidas por la sincronización no se cuentan.
+    """
+
+    COMUNAS_LISTADAS = (1, 2, 3)
+    PLAZO_MAXIMO = 24
+
+    def __init__(self):
+        self.aciertos = 0
+        self.fallos = 0
+        self._resultado = None
+        self._lock = threading.Lock()
+        self._monitor = None
+        self._monitor_ruta = None
+
+    def obtener(self):
+        version = self.version_datos()
+        with self._lock:
+            if self._resultado is not None and self._resultado.version == version:
+                self.aciertos += 1
+                return self._resultado
+            self.fallos += 1
+        resultado = self._calcular(version)
+        with self._lock:
+            self._resultado = resultado
+        return resultado
+
+    def invalidar(self):
+        with self._lock:
+            self._resultado = None
+
+    def version_datos(self):
+        maximo_id = Obra.select(fn.MAX(Obra.id)).scalar()
+        return (maximo_id, registro_cambios.version, db.database, self._data_version())
+
+    def cerrar(self):
+        with self._lock:
+            if self._monitor is not None:
+                self._monitor.close()
+            self._monitor = self._monitor_ruta = None
+
+    def _data_version(self):
+        # Una base en memoria es privada de cada conexión: no hay otras que la modifiquen
+        # y las escrituras propias ya las cuenta registro_cambios
+        if db.database is None or db.database == ':memory:' or db.database.startswith('file:'):
+            return None
+        with self._lock:
+            if self._monitor_ruta != db.database:
+                if self._monitor is not None:
+                    self._monitor.close()
+                self._monitor = sqlite3.connect(db.database, check_same_thread=False)
+                self._monitor_ruta = db.database
+            return self._monitor.execute('PRAGMA data_version').fetchone()[0]
+
+    def consultas(self):
+        # Consultas del cálculo; también las revisa GestionarObra.verificar_planes_consulta
+        def dimension(Modelo, clase):
+            return Modelo.select(Value(clase).alias('clase'), Modelo.id, Modelo.nombre, Value(None).alias('numero'))
+
+        barrios = (Barrio.select(Value('barrio').alias('clase'), Barrio.id, Barrio.nombre, Comuna.numero)
+                         .join(Comuna)
+                         .where(Comuna.numero.in_(self.COMUNAS_LISTADAS)))
+        return {
+            'dimensiones': (dimension(AreaResponsable, 'area') + dimension(TipoObra, 'tipo') +
+                            dimension(Etapa, 'etapa') + barrios),
+            'agregados_obras': (Obra.select(Obra.etapa, Obra.tipo_obra,
+                                            fn.COUNT(Obra.id),
+                                            fn.SUM(Obra.monto_contrato),
+                                            fn.COUNT(Obra.monto_contrato),
+                                            fn.SUM(Obra.plazo_meses <= self.PLAZO_MAXIMO))
+                                    .where(Obra.condicion_vigente())
+                                    .group_by(Obra.etapa, Obra.tipo_obra)),
+        }
+
+    def _calcular(self, version):
+        consultas = self.consultas()
+        nombres = {'area': {}, 'tipo': {}, 'etapa': {}}
+        barrios = []
+        for clase, pk, nombre, numero in consultas['dimensiones'].tuples():
+            if clase == 'barrio':
+                barrios.append((numero, nombre))
+            else:
+                nombres[clase][pk] = nombre
+
+        por_etapa = {}
+        por_tipo = {}
+        finalizadas_en_plazo = 0
+        montos = []
+        finalizada = next((pk for pk, nombre in nombres['etapa'].items() if nombre == "Finalizada"), None)
+        for etapa_id, tipo_id, cantidad, monto, con_monto, en_plazo in consultas['agregados_obras'].tuples():
+            if con_monto:
+                montos.append(monto)
+            if etapa_id in nombres['etapa']:
+                por_etapa[etapa_id] = por_etapa.get(etapa_id, 0) + cantidad
+                if etapa_id == finalizada:
+                    finalizadas_en_plazo += en_plazo or 0
+            if tipo_id in nombres['tipo']:
+                previo = por_tipo.get(tipo_id, (0, None))
+                suma = previo[1] if not con_monto else (previo[1] or 0) + monto
+                por_tipo[tipo_id] = (previo[0] + cantidad, suma)
+
+        barrios_por_comuna = {}
+        for numero, nombre in sorted(barrios):
+            barrios_por_comuna.setdefault(numero, []).append(nombre)
+
+        return Indicadores(
+            areas=sorted(nombres['area'].values()),
+            tipos=sorted(nombres['tipo'].values()),
+            obras_por_etapa=sorted(((nombres['etapa'][pk], cantidad) for pk, cantidad in por_etapa.items()),
+                                   key=lambda par: (-par[1], par[0])),
+            inversion_por_tipo=sorted(((nombres['tipo'][pk], cantidad, monto) for pk, (cantidad, monto) in por_tipo.items()),
+                                      key=lambda terna: (-terna[1], terna[0])),
+            barrios_por_comuna=barrios_por_comuna,
+            finalizadas_en_plazo=finalizadas_en_plazo,
+            monto_total=sum(montos) if montos else None,
+            version=version,
+        )
+
+
+motor_indicadores = MotorIndicadores()
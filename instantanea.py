@@ -0,0 +1,159 @@
+# instantanea.py
+# Instantáneas columnares de un DataFrame en arrays de NumPy (.npy) que se abren con mmap,
+# para no volver a leer y limpiar un CSV que no cambió.
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Cambiarla invalida las instantáneas existentes (p. ej. si cambia limpiar_datos).
+VERSION_INSTANTANEA = 1
+
+_INDICE = '__indice__'
+
+
+class InstantaneaColumnar:
+    """
+    Un DataFrame guardado como un directorio con un archivo .npy por array y un meta.json.
+    - números y booleanos: el array tal cual;
+    - enteros con nulos (Int64): valores int64 y máscara de nulos;
+    - fechas: int64 en la unidad original (NaT es el mínimo de int64);
+    - texto: códigos int32 (-1 es nulo) sobre un diccionario de valores distintos, guardado
+      como un único texto UTF-8 y los desplazamientos de cada valor.
+    Las columnas se abren con mmap y se materializan recién cuando se piden, una sola vez.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        with open(os.path.join(directorio, 'meta.json'), encoding='utf-8') as archivo:
+            self.meta = json.load(archivo)
+        self._columnas = {}
+
+    @property
+    def columnas(self):
+        return list(self.meta['columnas'])
+
+    def __len__(self):
+        return self.meta['filas']
+
+    def columna(self, nombre):
+        if nombre not in self._columnas:
+            self._columnas[nombre] = self._leer(nombre, self.meta['columnas'][nombre])
+        return self._columnas[nombre]
+
+    def a_dataframe(self, columnas=None):
+        """DataFrame con las columnas pedidas (todas por defecto), en el orden original."""
+        columnas = self.columnas if columnas is None else [c for c in self.columnas if c in set(columnas)]
+        indice = pd.Index(self._array(_INDICE))
+        return pd.DataFrame({nombre: self.columna(nombre).set_axis(indice) for nombre in columnas}, index=indice)
+
+    @classmethod
+    def guardar(cls, df, directorio, **metadatos):
+        """
+        Escribe df en directorio y retorna la instantánea. Se escribe en un directorio
+        temporal que reemplaza al anterior al final, así que un lector nunca ve una
+        instantánea a medio escribir.
+        """
+        temporal = f'{directorio}.tmp-{os.getpid()}'
+        shutil.rmtree(temporal, ignore_errors=True)
+        try:
+            os.makedirs(temporal)
+            columnas = {}
+            np.save(os.path.join(temporal, _INDICE + '.npy'), df.index.to_numpy(dtype='int64'))
+            for numero, (nombre, serie) in enumerate(df.items()):
+                columnas[nombre] = cls._escribir(temporal, f'c{numero}', serie)
+            meta = {'version': VERSION_INSTANTANEA, 'filas': len(df), 'columnas': columnas, **metadatos}
+            with open(os.path.join(temporal, 'meta.json'), 'w', encoding='utf-8') as archivo:
+                json.dump(meta, archivo, indent=1)
+            shutil.rmtree(directorio, ignore_errors=True)
+            os.replace(temporal, directorio)
+        except OSError:
+            # Sin espacio, sin permisos...: no dejar el directorio temporal a medio escribir
+            shutil.rmtree(temporal, ignore_errors=True)
+            raise
+        return cls(directorio)
+
+    # --- Formato de cada columna ---
+
+    @staticmethod
+    def _escribir(directorio, base, serie):
+        def guardar(sufijo, array):
+            np.save(os.path.join(directorio, f'{base}.{sufijo}.npy'), np.ascontiguousarray(array))
+
+        if isinstance(serie.dtype, pd.Int64Dtype):
+            guardar('valores', serie.fillna(0).to_numpy(dtype='int64'))
+            guardar('nulos', serie.isna().to_numpy())
+            return {'tipo': 'entero', 'base': base}
+        if pd.api.types.is_datetime64_dtype(serie):
+            guardar('valores', serie.to_numpy().view('int64'))
+            return {'tipo': 'fecha', 'base': base, 'dtype': str(serie.dtype)}
+        if pd.api.types.is_bool_dtype(serie) or pd.api.types.is_float_dtype(serie) \
+                or pd.api.types.is_integer_dtype(serie):
+            guardar('valores', serie.to_numpy())
+            return {'tipo': 'numero', 'base': base}
+        # Texto (o cualquier otra cosa, como texto)
+        codigos, distintos = pd.factorize(serie)
+        textos = [str(valor) for valor in distintos]
+        largos = np.fromiter(map(len, textos), dtype='int64', count=len(textos))
+        guardar('codigos', codigos.astype('int32'))
+        guardar('texto', np.frombuffer(''.join(textos).encode('utf-8'), dtype='uint8'))
+        guardar('desplazamientos', np.concatenate([[0], np.cumsum(largos)]))
+        return {'tipo': 'texto', 'base': base, 'dtype': str(serie.dtype)}
+
+    def _array(self, base, sufijo=None):
+        nombre = f'{base}.{sufijo}.npy' if sufijo else f'{base}.npy'
+        # 'c': copia al escribir, así el DataFrame resultante se puede modificar sin tocar el archivo
+        return np.load(os.path.join(self.directorio, nombre), mmap_mode='c')
+
+    def _leer(self, nombre, columna):
+        tipo, base = columna['tipo'], columna['base']
+        if tipo == 'numero':
+            return pd.Series(self._array(base, 'valores'), name=nombre)
+        if tipo == 'entero':
+            return pd.Series(pd.arrays.IntegerArray(self._array(base, 'valores'),
+                                                    self._array(base, 'nulos')), name=nombre)
+        if tipo == 'fecha':
+            return pd.Series(self._array(base, 'valores').view(columna['dtype']), name=nombre)
+        texto = self._array(base, 'texto').tobytes().decode('utf-8')
+        desplazamientos = self._array(base, 'desplazamientos').tolist()
+        distintos = np.array([texto[inicio:fin] for inicio, fin in zip(desplazamientos, desplazamientos[1:])] + [None],
+                             dtype=object)
+        # El código -1 (nulo) toma el último elemento, None
+        valores = distintos[self._array(base, 'codigos')]
+        return pd.Series(valores, name=nombre, dtype=columna['dtype'])
+
+
+def huella_archivo(path, tamano_bloque=1 << 20):
+    """Hash BLAKE2b del contenido del archivo."""
+    digesto = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as archivo:
+        while bloque := archivo.read(tamano_bloque):
+            digesto.update(bloque)
+    return digesto.hexdigest()
+
+
+def abrir_vigente(directorio, path_origen, **parametros):
+    """
+    Retorna la instantánea de directorio si corresponde al estado actual de path_origen y a
+    los mismos parametros (delimitador, codificación...), o None. Primero compara tamaño y
+    fecha de modificación; si solo cambió la fecha, compara el hash del contenido y, si
+    coincide, actualiza la fecha guardada para no volver a calcularlo.
+    """
+    if not os.path.exists(os.path.join(directorio, 'meta.json')):
+        return None
+    instantanea = InstantaneaColumnar(directorio)
+    meta = instantanea.meta
+    estado = os.stat(path_origen)
+    if (meta.get('version') != VERSION_INSTANTANEA or meta.get('tamano') != estado.st_size
+            or any(meta.get(clave) != valor for clave, valor in parametros.items())):
+        return None
+    if meta.get('mtime_ns') != estado.st_mtime_ns:
+        if meta.get('hash') != huella_archivo(path_origen):
+            return None
+        meta['mtime_ns'] = estado.st_mtime_ns
+        with open(os.path.join(directorio, 'meta.json'), 'w', encoding='utf-8') as archivo:
+            json.dump(meta, archivo, indent=1)
+    return instantanea
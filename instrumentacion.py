@@ -0,0 +1,245 @@
+# instrumentacion.py
+# Tiempos por etapa, consultas SQL por sitio de llamada y reportes por consola con niveles.
+import functools
+import logging
+import threading
+import time
+from collections import namedtuple
+
+# Lo que reciben los ganchos de perfilado. tipo es 'etapa' (detalle = filas procesadas)
+# o 'sql' (detalle = texto de la sentencia).
+Evento = namedtuple('Evento', ['tipo', 'sitio', 'segundos', 'detalle'])
+
+SIN_SITIO = '(fuera de etapa)'
+
+
+class Estadisticas:
+    """
+    Acumula, por sitio de llamada (p. ej. 'GestionarObra.cargar_datos'), cantidad de llamadas,
+    segundos, filas procesadas y consultas SQL con su latencia. Las consultas se atribuyen a
+    la etapa más interna abierta en el hilo que las ejecuta, y los tiempos de una etapa
+    incluyen los de las etapas anidadas.
+
+    Con activa = False las etapas no miden nada y el costo es el de un if.
+    """
+
+    def __init__(self):
+        self.activa = True
+        self._sitios = {}
+        self._ganchos = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # --- Registro ---
+
+    def etapa(self, sitio):
+        """Context manager que mide el bloque como una llamada a sitio."""
+        return _Etapa(self, sitio)
+
+    def agregar_filas(self, cantidad):
+        """Suma filas procesadas a la etapa abierta más interna (para filas por segundo)."""
+        pila = self._pila()
+        if self.activa and pila:
+            pila[-1].filas += int(cantidad)
+
+    def registrar_sql(self, segundos, sql=None, sentencias=1):
+        """Registra sentencias SQL ejecutadas por la etapa abierta más interna."""
+        if not self.activa:
+            return
+        pila = self._pila()
+        sitio = pila[-1].sitio if pila else SIN_SITIO
+        with self._lock:
+            datos = self._datos(sitio)
+            datos['consultas_sql'] += sentencias
+            datos['segundos_sql'] += segundos
+            datos['sql_mas_lenta'] = max(datos['sql_mas_lenta'], segundos / sentencias)
+        self._notificar(Evento('sql', sitio, segundos, sql))
+
+    def agregar_gancho(self, gancho):
+        """
+        Registra un callable que recibe un Evento al cerrar cada etapa y en cada consulta.
+        Sirve para perfilar: volcar los eventos a un archivo, armar un flame graph, etc.
+        """
+        self._ganchos.append(gancho)
+
+    def quitar_gancho(self, gancho):
+        self._ganchos.remove(gancho)
+
+    # --- Consulta ---
+
+    def resumen(self):
+        """Retorna {sitio: métricas} con una copia de lo acumulado, incluidas filas por segundo."""
+        with self._lock:
+            copia = {sitio: dict(datos) for sitio, datos in self._sitios.items()}
+        for datos in copia.values():
+            datos['filas_por_segundo'] = (round(datos['filas'] / datos['segundos'])
+                                          if datos['filas'] and datos['segundos'] else None)
+            datos['latencia_sql_media'] = (datos['segundos_sql'] / datos['consultas_sql']
+                                           if datos['consultas_sql'] else None)
+        return copia
+
+    def sitio(self, sitio):
+        """Métricas de un sitio de llamada, o None si no se registró."""
+        return self.resumen().get(sitio)
+
+    def total_sql(self):
+        with self._lock:
+            return sum(datos['consultas_sql'] for datos in self._sitios.values())
+
+    def reiniciar(self):
+        with self._lock:
+            self._sitios.clear()
+
+    def mostrar(self):
+        print("\n--- Estadísticas de ejecución ---")
+        for sitio, datos in sorted(self.resumen().items(), key=lambda item: -item[1]['segundos']):
+            linea = (f"- {sitio}: {datos['llamadas']} llamadas, {datos['segundos']:.3f}s, "
+                     f"{datos['consultas_sql']} consultas SQL ({datos['segundos_sql']:.3f}s)")
+            if datos['filas_por_segundo']:
+                linea += f", {datos['filas']} filas ({datos['filas_por_segundo']} filas/s)"
+            print(linea)
+
+    # --- Internos ---
+
+    def _pila(self):
+        pila = getattr(self._local, 'pila', None)
+        if pila is None:
+            pila = self._local.pila = []
+        return pila
+
+    def _datos(self, sitio):
+        datos = self._sitios.get(sitio)
+        if datos is None:
+            datos = self._sitios[sitio] = {
+                'llamadas': 0, 'segundos': 0.0, 'filas': 0,
+                'consultas_sql': 0, 'segundos_sql': 0.0, 'sql_mas_lenta': 0.0,
+            }
+        return datos
+
+    def _cerrar(self, etapa, segundos):
+        with self._lock:
+            datos = self._datos(etapa.sitio)
+            datos['llamadas'] += 1
+            datos['segundos'] += segundos
+            datos['filas'] += etapa.filas
+        self._notificar(Evento('etapa', etapa.sitio, segundos, etapa.filas))
+
+    def _notificar(self, evento):
+        for gancho in self._ganchos:
+            gancho(evento)
+
+
+class _Etapa:
+    __slots__ = ('estadisticas', 'sitio', 'filas', 'inicio')
+
+    def __init__(self, estadisticas, sitio):
+        self.estadisticas = estadisticas
+        self.sitio = sitio
+        self.filas = 0
+        self.inicio = None
+
+    def __enter__(self):
+        if self.estadisticas.activa:
+            self.estadisticas._pila().append(self)
+            self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.inicio is not None:
+            segundos = time.perf_counter() - self.inicio
+            self.estadisticas._pila().pop()
+            self.estadisticas._cerrar(self, segundos)
+        return False
+
+
+estadisticas = Estadisticas()
+
+
+def instrumentado(funcion):
+    """Decorador: mide cada llamada a funcion como una etapa con su __qualname__ como sitio."""
+    sitio = funcion.__qualname__
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if not estadisticas.activa:
+            return funcion(*args, **kwargs)
+        with estadisticas.etapa(sitio):
+            return funcion(*args, **kwargs)
+
+    return envoltura
+
+
+# --- Reportes por consola ---
+
+class LimiteFrecuencia(logging.Filter):
+    """
+    Deja pasar como máximo `limite` mensajes con la misma plantilla cada `intervalo` segundos.
+    Los mensajes por fila o por obra comparten plantilla, así que una carga grande emite unas
+    pocas líneas por segundo en lugar de una por registro; al reabrirse la ventana se informa
+    cuántos se omitieron.
+    """
+
+    def __init__(self, limite=20, intervalo=1.0):
+        super().__init__()
+        self.limite = limite
+        self.intervalo = intervalo
+        self._ventanas = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not self.limite:
+            return True
+        ahora = time.monotonic()
+        clave = (record.name, record.levelno, record.msg)
+        with self._lock:
+            inicio, emitidos, omitidos = self._ventanas.get(clave, (ahora, 0, 0))
+            if ahora - inicio >= self.intervalo:
+                inicio, emitidos = ahora, 0
+            if emitidos >= self.limite:
+                self._ventanas[clave] = (inicio, emitidos, omitidos + 1)
+                return False
+            self._ventanas[clave] = (inicio, emitidos + 1, 0)
+        if omitidos:
+            record.omitidos = omitidos
+        return True
+
+
+class _Consola(logging.Handler):
+    # Escribe con print, como el resto del programa (respeta redirecciones de sys.stdout).
+    def emit(self, record):
+        try:
+            mensaje = self.format(record)
+            omitidos = getattr(record, 'omitidos', 0)
+            if omitidos:
+                mensaje += f" ({omitidos} mensajes similares omitidos)"
+            print(mensaje)
+        except Exception:
+            self.handleError(record)
+
+
+reportes = logging.getLogger('obras')
+_limite = LimiteFrecuencia()
+_consola = _Consola()
+_consola.addFilter(_limite)
+reportes.addHandler(_consola)
+reportes.setLevel(logging.INFO)
+reportes.propagate = False
+
+NIVELES = {
+    'silencio': logging.CRITICAL + 10,
+    'error': logging.ERROR,
+    'aviso': logging.WARNING,
+    'info': logging.INFO,
+    'detalle': logging.DEBUG,
+}
+
+
+def configurar_reportes(nivel='info', limite=20, intervalo=1.0):
+    """
+    Ajusta los mensajes por consola: nivel es 'silencio', 'error', 'aviso', 'info' (por
+    defecto) o 'detalle' (incluye un mensaje por registro cargado). limite e intervalo
+    acotan cuántos mensajes iguales se muestran por segundo; limite=0 no acota.
+    """
+    reportes.setLevel(NIVELES[nivel])
+    _limite.limite = limite
+    _limite.intervalo = intervalo
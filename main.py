@@ -1,42 +1,127 @@
-from gestionar_obras import GestionarObra
-from modelo_orm2 import db, Obra # Asegúrate de importar 'db'
+# main.py
+# Punto de entrada por línea de comandos. Cada subcomando importa solo lo que usa: cargar,
+# sincronizar, crear y demo necesitan gestionar_obras (pandas y numpy); indicadores y buscar
+# solo peewee, así que arrancan en una fracción del tiempo (ver benchmarks/bench_arranque.py).
+#
+#   python main.py cargar [--csv ARCHIVO] [--procesos 4]
+#   python main.py sincronizar [--marcar-removidas]
+#   python main.py indicadores
+#   python main.py buscar escuela "hosp*" [--etapa Finalizada] [--comuna 4] [--limite 10]
+#   python main.py buscar --cerca -34.60 -58.38 [--radio 1000]
+#   python main.py crear obras.json
+#   python main.py demo                 # demostración interactiva (también sin subcomando)
+#
+# Opciones generales: --db ARCHIVO, --nivel {silencio,error,aviso,info,detalle} y
+# --estadisticas (tiempos y consultas SQL por etapa al terminar).
+import argparse
 import sys
-import datetime
 
+CSV_POR_DEFECTO = 'observatorio-de-obras-urbanas.csv'
 
-def run_app():
-    # Conectar a la base de datos y mapear ORM
-    if not GestionarObra.conectar_db():
-        print("No se pudo conectar a la base de datos. Saliendo.")
-        sys.exit(1)
+
+def cargar(args):
+    from gestionar_obras import GestionarObra
+    from modelo_orm2 import Obra
+    from instrumentacion import reportes
 
     if not GestionarObra.mapear_orm():
-        print("No se pudieron mapear las tablas ORM. Saliendo.")
-        db.close()
-        sys.exit(1)
+        return 1
+    if Obra.select().exists():
+        reportes.error("La base ya tiene obras cargadas; use 'sincronizar' para actualizarla con el CSV.")
+        return 1
+    if args.procesos:
+        resultado = GestionarObra.procesar_csv_en_paralelo(args.csv, args.delimitador, args.codificacion,
+                                                           procesos=args.procesos)
+    else:
+        df_limpio = GestionarObra.datos_limpios(args.csv, args.delimitador, args.codificacion)
+        if df_limpio is None:
+            return 1
+        # Sobre la base vacía la sincronización carga todo y deja las huellas para 'sincronizar'
+        resultado = GestionarObra.sincronizar_datos(df_limpio)
+    return 0 if resultado else 1
 
-    try:
-        if Obra.select().count() == 0:
-            print("La tabla de obras está vacía. Cargando datos del CSV...")
-            df = GestionarObra.extraer_datos()
-            if df is not None:
-                df_limpio = GestionarObra.limpiar_datos(df)
-                if df_limpio is not None:
-                    GestionarObra.cargar_datos(df_limpio)
-                else:
-                    print("La limpieza de datos falló. No se cargarán datos iniciales.")
-            else:
-                print("La extracción de datos del CSV falló. No se cargarán datos iniciales.")
+
+def sincronizar(args):
+    from gestionar_obras import GestionarObra
+
+    if not GestionarObra.mapear_orm():
+        return 1
+    resultado = GestionarObra.sincronizar_csv(args.csv, args.delimitador, args.codificacion,
+                                              marcar_removidas=args.marcar_removidas)
+    return 0 if resultado else 1
+
+
+def indicadores(args):
+    from modelo_orm2 import conexion, crear_esquema
+    from indicadores import motor_indicadores
+
+    with conexion():
+        crear_esquema()
+        motor_indicadores.obtener().mostrar()
+    return 0
+
+
+def buscar(args):
+    from modelo_orm2 import conexion, crear_esquema
+    import busquedas
+
+    texto = ' '.join(args.texto)
+    if bool(texto) == bool(args.cerca):
+        print("Indique un texto a buscar o --cerca LAT LNG (uno de los dos).")
+        return 2
+    with conexion():
+        crear_esquema()
+        if texto:
+            resultados = busquedas.buscar_texto(texto, args.limite, args.etapa, args.comuna)
+            medida = "relevancia {:.2f}"
+        elif args.radio:
+            resultados = busquedas.obras_en_radio(*args.cerca, args.radio, args.etapa, args.comuna)[:args.limite]
+            medida = "a {:.0f} m"
         else:
-            print("La tabla de obras ya contiene datos. Saltando la carga inicial del CSV.")
+            resultados = busquedas.obras_cercanas(*args.cerca, args.limite, args.etapa, args.comuna)
+            medida = "a {:.0f} m"
+        print(f"\n--- {len(resultados)} obras encontradas ---")
+        for obra, valor in resultados:
+            print(f"- {obra.id}: {obra.nombre} ({obra.direccion or 'sin dirección'}), {medida.format(valor)}")
+    return 0
+
+
+def crear(args):
+    from gestionar_obras import GestionarObra
+
+    if not GestionarObra.mapear_orm():
+        return 1
+    reporte = GestionarObra.crear_obras(args.archivo, args.delimitador, args.codificacion)
+    return 0 if reporte is not None else 1
+
+
+def demo(args):
+    import datetime
+    from gestionar_obras import GestionarObra
+    from modelo_orm2 import Obra, HuellaObra, sesion_escritura
+
+    if not GestionarObra.mapear_orm():
+        print("No se pudieron mapear las tablas ORM. Saliendo.")
+        return 1
 
-        print("\n--- Demostración de Nuevas Obras y su Ciclo de Vida ---")
+    # La sincronización incremental carga todo si la base está vacía y, si no,
+    # solo escribe las filas nuevas o cambiadas del CSV.
+    if Obra.select().count() == 0 or HuellaObra.select().exists():
+        print("Sincronizando la base de datos con el CSV...")
+        if GestionarObra.sincronizar_csv() is False:
+            print("La sincronización con el CSV falló. Se continúa con los datos existentes.")
+    else:
+        print("La tabla de obras ya contiene datos cargados sin huellas de sincronización. Saltando la carga del CSV.")
 
-        # Obra de Ejemplo 1
-        print("\nCreando y gestionando Obra de Ejemplo 1:")
-        nueva_obra_1 = GestionarObra.nueva_obra()
-        if nueva_obra_1:
-            print(f"Obra '{nueva_obra_1.nombre}' iniciada como '{nueva_obra_1.etapa.nombre}'.")
+    print("\n--- Demostración de Nuevas Obras y su Ciclo de Vida ---")
+
+    # Obra de Ejemplo 1
+    print("\nCreando y gestionando Obra de Ejemplo 1:")
+    nueva_obra_1 = GestionarObra.nueva_obra()
+    if nueva_obra_1:
+        print(f"Obra '{nueva_obra_1.nombre}' iniciada como '{nueva_obra_1.etapa.nombre}'.")
+        # Los pasos del ciclo de vida se escriben juntos al salir: un único UPDATE
+        with sesion_escritura():
             nueva_obra_1.iniciar_contratacion("LIC-2025-001", "Licitación Pública")
             nueva_obra_1.adjudicar_obra("Constructora Ejemplo S.A.", "20-12345678-9", "EXP-2025-001")
             nueva_obra_1.iniciar_obra(
@@ -50,13 +135,14 @@ def run_app():
             nueva_obra_1.incrementar_mano_obra(10)
             nueva_obra_1.actualizar_porcentaje_avance(75.0)
             nueva_obra_1.finalizar_obra()
-            print(f"Obra '{nueva_obra_1.nombre}' (ID: {nueva_obra_1.id}) completó su ciclo de vida.")
+        print(f"Obra '{nueva_obra_1.nombre}' (ID: {nueva_obra_1.id}) completó su ciclo de vida.")
 
-        # Obra de Ejemplo 2
-        print("\nCreando y gestionando Obra de Ejemplo 2:")
-        nueva_obra_2 = GestionarObra.nueva_obra()
-        if nueva_obra_2:
-            print(f"Obra '{nueva_obra_2.nombre}' iniciada como '{nueva_obra_2.etapa.nombre}'.")
+    # Obra de Ejemplo 2
+    print("\nCreando y gestionando Obra de Ejemplo 2:")
+    nueva_obra_2 = GestionarObra.nueva_obra()
+    if nueva_obra_2:
+        print(f"Obra '{nueva_obra_2.nombre}' iniciada como '{nueva_obra_2.etapa.nombre}'.")
+        with sesion_escritura():
             nueva_obra_2.iniciar_contratacion("LIC-2025-002", "Licitación Privada")
             nueva_obra_2.adjudicar_obra("Constructora Dos S.A.", "20-98765432-1", "EXP-2025-002")
             nueva_obra_2.iniciar_obra(
@@ -70,17 +156,85 @@ def run_app():
             nueva_obra_2.incrementar_mano_obra(5)
             nueva_obra_2.actualizar_porcentaje_avance(100.0)
             nueva_obra_2.finalizar_obra()
-            print(f"Obra '{nueva_obra_2.nombre}' (ID: {nueva_obra_2.id}) completó su ciclo de vida.")
+        print(f"Obra '{nueva_obra_2.nombre}' (ID: {nueva_obra_2.id}) completó su ciclo de vida.")
+
+    GestionarObra.obtener_indicadores()
+    return 0
+
+
+def crear_parser():
+    def opciones_generales(parser, por_defecto=True):
+        # Se aceptan antes o después del subcomando; en los subcomandos no pisan lo ya indicado
+        defecto = (lambda valor: valor) if por_defecto else (lambda valor: argparse.SUPPRESS)
+        parser.add_argument('--db', default=defecto(None),
+                            help="archivo de la base SQLite (por defecto obras_urbanas.db)")
+        parser.add_argument('--nivel', default=defecto('info'),
+                            choices=['silencio', 'error', 'aviso', 'info', 'detalle'],
+                            help="mensajes por consola (por defecto info)")
+        parser.add_argument('--estadisticas', action='store_true', default=defecto(False),
+                            help="muestra al terminar los tiempos y consultas SQL por etapa")
+        return parser
+
+    parser = opciones_generales(argparse.ArgumentParser(description="Gestión de obras urbanas."))
+    generales = opciones_generales(argparse.ArgumentParser(add_help=False), por_defecto=False)
+    subcomandos = parser.add_subparsers(dest='comando', metavar='SUBCOMANDO')
+
+    def con_csv(subparser, delimitador=';', codificacion=None):
+        subparser.add_argument('--delimitador', default=delimitador, help=f"por defecto '{delimitador}'")
+        subparser.add_argument('--codificacion', default=codificacion,
+                               help=f"por defecto {codificacion}" if codificacion else "por defecto se detecta")
+        return subparser
+
+    p = con_csv(subcomandos.add_parser('cargar', parents=[generales], help="carga el CSV en una base vacía"))
+    p.add_argument('--csv', default=CSV_POR_DEFECTO)
+    p.add_argument('--procesos', type=int, default=0, help="limpia el CSV en paralelo con N procesos (la base queda sin huellas: "
+                        "no se podrá actualizar con 'sincronizar')")
+    p.set_defaults(funcion=cargar)
+
+    p = con_csv(subcomandos.add_parser('sincronizar', parents=[generales], help="aplica a la base los cambios del CSV"))
+    p.add_argument('--csv', default=CSV_POR_DEFECTO)
+    p.add_argument('--marcar-removidas', action='store_true', help="marca las obras que ya no están en el CSV")
+    p.set_defaults(funcion=sincronizar)
+
+    p = subcomandos.add_parser('indicadores', parents=[generales], help="muestra los indicadores de las obras")
+    p.set_defaults(funcion=indicadores)
 
-        GestionarObra.obtener_indicadores()
+    p = subcomandos.add_parser('buscar', parents=[generales], help="busca obras por texto o por cercanía")
+    p.add_argument('texto', nargs='*', help="palabras del nombre o la descripción (palabra* busca por prefijo)")
+    p.add_argument('--cerca', nargs=2, type=float, metavar=('LAT', 'LNG'), help="obras más cercanas al punto")
+    p.add_argument('--radio', type=float, help="con --cerca, solo las obras a menos de RADIO metros")
+    p.add_argument('--etapa', help="nombre de la etapa")
+    p.add_argument('--comuna', type=int, help="número de comuna")
+    p.add_argument('--limite', type=int, default=20)
+    p.set_defaults(funcion=buscar)
 
+    p = con_csv(subcomandos.add_parser('crear', parents=[generales], help="crea obras en etapa 'Proyecto' desde un .json o .csv"),
+                delimitador=',', codificacion='utf-8-sig')
+    p.add_argument('archivo')
+    p.set_defaults(funcion=crear)
+
+    p = subcomandos.add_parser('demo', parents=[generales], help="demostración interactiva del ciclo de vida de una obra")
+    p.set_defaults(funcion=demo)
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+
+    from instrumentacion import configurar_reportes, estadisticas
+    from modelo_orm2 import db, configurar_db
+
+    configurar_reportes(args.nivel)
+    if args.db:
+        configurar_db(args.db)
+    try:
+        return (args.funcion if args.comando else demo)(args)
     finally:
         if not db.is_closed():
             db.close()
-            print("\nConexión a la base de datos cerrada.")
-
-if __name__ == "__main__":
-    run_app()
-    GestionarObra.obtener_indicadores()
+        if args.estadisticas:
+            estadisticas.mostrar()
 
 
+if __name__ == "__main__":
+    sys.exit(main())
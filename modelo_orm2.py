@@ -1,41 +1,445 @@
 from peewee import *
+from peewee import Expression
 from datetime import date
+import math
+import numbers
+import re
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import time
+
+from instrumentacion import estadisticas, instrumentado, reportes
+
+# Perfiles de PRAGMAs que se aplican a cada conexión nueva.
+# foreign_keys va en todos: sin él SQLite no aplica ON DELETE SET NULL de HuellaObra.obra.
+PERFILES_DB = {
+    # Valores por defecto de SQLite (salvo foreign_keys)
+    'basico': {'foreign_keys': 1},
+    # WAL permite lectores concurrentes con un escritor; con WAL, synchronous=normal
+    # no arriesga la integridad de la base (solo la última transacción ante un corte).
+    'rendimiento': {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'cache_size': -64 * 1024,           # en KiB cuando es negativo: 64 MiB
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'memory',
+        'foreign_keys': 1,
+    },
+}
+
+# Segundos que una conexión espera a que se libere un bloqueo antes de fallar con
+# "database is locked".
+ESPERA_BLOQUEO = 30
+
+
+class SqliteInstrumentada(SqliteDatabase):
+    """
+    SqliteDatabase que registra cada consulta (y su latencia) en instrumentacion.estadisticas,
+    atribuida a la etapa en curso. El tiempo de una SELECT no incluye la lectura de las filas.
+    """
+
+    def rollback(self):
+        # Lo que cache_dimensiones tenía pendiente de la transacción se deshizo con ella
+        cache_dimensiones.descartar_pendientes()
+        super().rollback()
+
+    def execute_sql(self, sql, params=None):
+        if sql.startswith('ROLLBACK TO SAVEPOINT'):
+            cache_dimensiones.descartar_pendientes()
+        if not estadisticas.activa:
+            return super().execute_sql(sql, params)
+        inicio = time.perf_counter()
+        try:
+            return super().execute_sql(sql, params)
+        finally:
+            estadisticas.registrar_sql(time.perf_counter() - inicio, sql)
+
+
+# SqliteDatabase mantiene una conexión por hilo; conexion() administra su ciclo de vida.
+db = SqliteInstrumentada('obras_urbanas.db', pragmas=PERFILES_DB['rendimiento'], timeout=ESPERA_BLOQUEO)
+
+
+def configurar_db(ruta='obras_urbanas.db', perfil='rendimiento', espera_bloqueo=ESPERA_BLOQUEO, **pragmas):
+    """
+    Reconfigura la base de datos con un perfil de PRAGMAs (ver PERFILES_DB), que se puede
+    ajustar con pragmas adicionales, p. ej. configurar_db(perfil='rendimiento', cache_size=-200000).
+    Cierra la conexión del hilo actual si estaba abierta y vacía cache_dimensiones, cuyos
+    ids son de la base anterior.
+    """
+    db.init(ruta, pragmas={**PERFILES_DB[perfil], **pragmas}, timeout=espera_bloqueo)
+    cache_dimensiones.invalidar()
+
+
+@contextmanager
+def conexion():
+    """
+    Asegura una conexión abierta en el hilo actual. Al salir la cierra solo si la abrió
+    este bloque, así no corta la conexión de quien lo llamó. Cada hilo tiene la suya.
+    """
+    abierta_aqui = db.connect(reuse_if_open=True)
+    try:
+        yield db
+    finally:
+        if abierta_aqui and not db.is_closed():
+            db.close()
+
+
+class CacheDimensiones:
+    """
+    Caché compartida valor -> id para las tablas de dimensión (Etapa, TipoObra, Empresa, ...).
+    Es acotada (se descartan las entradas menos usadas), se llena de forma perezosa con la
+    tabla completa la primera vez que se consulta un modelo y se invalida cuando la tabla
+    se modifica. Lleva contadores de aciertos y fallos.
+    Lo leído o creado dentro de una transacción puede incluir filas sin confirmar: queda
+    pendiente, visible solo para esa transacción, y pasa a la caché compartida cuando se
+    confirma. Si se deshace (también un savepoint), se descarta.
+    """
+
+    def __init__(self, tamano_maximo=1024):
+        self.tamano_maximo = tamano_maximo
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()  # (Modelo, valor) -> id
+        self._calentados = set()
+        self._lock = threading.RLock()
+        self._transaccion = threading.local()
+
+    def obtener(self, Modelo, valor):
+        """
+        Retorna una instancia de Modelo con id y campo clave cargados, creando la fila
+        si no existe (como get_or_create) pero sin consultar la base si ya está en caché.
+        """
+        campo = Modelo.campo_clave
+        pk = self.buscar(Modelo, [valor]).get(valor)
+        if pk is None:
+            instancia, _ = Modelo.get_or_create(**{campo: valor})
+            pk = instancia.id
+            self.registrar(Modelo, {valor: pk})
+        return Modelo(id=pk, **{campo: valor})
+
+    def obtener_id(self, Modelo, valor):
+        return self.obtener(Modelo, valor).id
+
+    def buscar(self, Modelo, valores):
+        """
+        Retorna un dict valor -> id con los valores que están en caché (o en la tabla, si
+        el modelo todavía no se había calentado). Los faltantes no se crean.
+        """
+        with self._lock:
+            pendiente = self._pendiente()
+            if Modelo not in self._calentados and (pendiente is None or Modelo not in pendiente['calentados']):
+                self._calentar(Modelo)
+            encontrados = {}
+            for valor in valores:
+                clave = (Modelo, valor)
+                if clave in self._entradas:
+                    self._entradas.move_to_end(clave)
+                    encontrados[valor] = self._entradas[clave]
+                    self.aciertos += 1
+                elif pendiente is not None and clave in pendiente['entradas']:
+                    encontrados[valor] = pendiente['entradas'][clave]
+                    self.aciertos += 1
+                else:
+                    self.fallos += 1
+            return encontrados
+
+    def registrar(self, Modelo, ids):
+        """Agrega ids valor -> id; dentro de una transacción quedan pendientes hasta confirmarla."""
+        with self._lock:
+            pendiente = self._pendiente()
+            if pendiente is not None:
+                pendiente['entradas'].update(((Modelo, valor), pk) for valor, pk in ids.items())
+                return
+            self._registrar(Modelo, ids)
+
+    def invalidar(self, Modelo=None, solo_altas=False):
+        """
+        Descarta las entradas de Modelo (de todos si es None). Con solo_altas, para filas
+        nuevas, las entradas siguen valiendo y solo se marca que la tabla ya no está completa.
+        """
+        with self._lock:
+            pendiente = getattr(self._transaccion, 'estado', None)
+            if Modelo is None:
+                self._entradas.clear()
+                self._calentados.clear()
+                self.descartar_pendientes()
+                return
+            self._calentados.discard(Modelo)
+            if pendiente is not None:
+                pendiente['calentados'].discard(Modelo)
+            if solo_altas:
+                return
+            for clave in [clave for clave in self._entradas if clave[0] is Modelo]:
+                del self._entradas[clave]
+            if pendiente is not None:
+                for clave in [clave for clave in pendiente['entradas'] if clave[0] is Modelo]:
+                    del pendiente['entradas'][clave]
+
+    def descartar_pendientes(self):
+        """Olvida lo registrado en la transacción en curso del hilo (p. ej. al deshacer un savepoint)."""
+        self._transaccion.estado = None
+
+    def estadisticas(self):
+        consultas = self.aciertos + self.fallos
+        return {
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+            'entradas': len(self._entradas),
+        }
+
+    def reiniciar_estadisticas(self):
+        self.aciertos = 0
+        self.fallos = 0
+
+    def _calentar(self, Modelo):
+        campo = getattr(Modelo, Modelo.campo_clave)
+        filas = dict(Modelo.select(campo, Modelo.id).limit(self.tamano_maximo).tuples())
+        pendiente = self._pendiente()
+        if pendiente is not None:
+            pendiente['calentados'].add(Modelo)
+            self.registrar(Modelo, filas)
+        else:
+            self._calentados.add(Modelo)
+            self._registrar(Modelo, filas)
+
+    def _registrar(self, Modelo, ids):
+        for valor, pk in ids.items():
+            self._entradas[(Modelo, valor)] = pk
+            self._entradas.move_to_end((Modelo, valor))
+        while len(self._entradas) > self.tamano_maximo:
+            descartado, _ = self._entradas.popitem(last=False)
+            # El modelo ya no está completo en caché: los fallos vuelven a consultar
+            self._calentados.discard(descartado[0])
+
+    def _pendiente(self):
+        # Estado pendiente de la transacción en curso del hilo, o None fuera de una transacción.
+        # Cada transacción de primer nivel tiene el suyo; el de una transacción deshecha no
+        # se confirma nunca (peewee descarta sus after_commit) y se reemplaza en la siguiente
+        if not db.in_transaction():
+            return None
+        transaccion = db.top_transaction()
+        estado = getattr(self._transaccion, 'estado', None)
+        if estado is None or estado['transaccion'] is not transaccion:
+            estado = self._transaccion.estado = {'transaccion': transaccion, 'entradas': {}, 'calentados': set()}
+            db.after_commit(lambda: self._confirmar(estado))
+        return estado
+
+    def _confirmar(self, estado):
+        with self._lock:
+            if getattr(self._transaccion, 'estado', None) is not estado:
+                return  # descartado por un savepoint deshecho o una invalidación total
+            self._transaccion.estado = None
+            for Modelo in {Modelo for Modelo, _ in estado['entradas']}:
+                self._registrar(Modelo, {valor: pk for (M, valor), pk in estado['entradas'].items() if M is Modelo})
+            # Completo solo si además ninguna entrada se descartó al registrar por el límite de tamaño
+            for Modelo in estado['calentados']:
+                if all((Modelo, valor) in self._entradas for (M, valor) in estado['entradas'] if M is Modelo):
+                    self._calentados.add(Modelo)
+
+
+cache_dimensiones = CacheDimensiones()
+
+
+class RegistroCambios:
+    """
+    Contador de escrituras hechas desde este proceso a través de los modelos. Junto con
+    datos de la base (máximo id, PRAGMA data_version) sirve como versión barata de los
+    datos para invalidar resultados cacheados.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def registrar(self, Modelo):
+        with self._lock:
+            self.version += 1
+
+
+registro_cambios = RegistroCambios()
+
+
+class SesionEscritura:
+    """
+    Escritura diferida: mientras la sesión está activa en el hilo (ver sesion_escritura),
+    save() sobre filas existentes no escribe sino que acumula los campos guardados de cada
+    fila, y guardar() los aplica con un UPDATE por fila con solo esos campos. Varios pasos
+    del ciclo de vida sobre una obra terminan así en una única escritura angosta.
+    Las consultas hechas dentro de la sesión no ven los cambios pendientes.
+    """
+
+    def __init__(self):
+        self._pendientes = {}  # (Modelo, pk) -> {campo: valor}
+
+    def __len__(self):
+        return len(self._pendientes)
+
+    def diferir(self, instancia):
+        # Lo mismo que escribiría save(): los campos modificados o, si el modelo no tiene
+        # only_save_dirty, todos
+        campos = (instancia.dirty_fields if instancia._meta.only_save_dirty
+                  else instancia._meta.sorted_fields)
+        nombre_pk = instancia._meta.primary_key.name
+        valores = {campo.name: instancia.__data__.get(campo.name) for campo in campos if campo.name != nombre_pk}
+        if valores:
+            self._pendientes.setdefault((type(instancia), instancia._pk), {}).update(valores)
+        instancia._dirty -= set(valores)
+        return 1 if valores else False
+
+    @instrumentado
+    def guardar(self):
+        """Aplica los cambios pendientes, un UPDATE por fila, y retorna cuántos hubo."""
+        pendientes, self._pendientes = self._pendientes, {}
+        with db.atomic():
+            for (Modelo, pk), valores in pendientes.items():
+                Modelo.update(**valores).where(Modelo._meta.primary_key == pk).execute()
+        estadisticas.agregar_filas(len(pendientes))
+        reportes.debug("Sesión de escritura: %s filas actualizadas.", len(pendientes))
+        return len(pendientes)
+
+    def descartar(self):
+        self._pendientes.clear()
+
+
+_sesiones = threading.local()
+
+
+@contextmanager
+def sesion_escritura():
+    """
+    Abre una transacción con una SesionEscritura activa en el hilo actual y, al salir sin
+    errores, aplica los cambios pendientes antes de confirmarla. Si hay una excepción se
+    descartan junto con el resto de la transacción.
+
+        with sesion_escritura():
+            obra.iniciar_contratacion(...)
+            obra.actualizar_porcentaje_avance(25.0)
+            obra.finalizar_obra()              # un solo UPDATE al salir
+
+    Anidada dentro de otra sesión del mismo hilo, se une a ella: no abre transacción ni
+    escribe al salir, y sus cambios se aplican con los de la sesión exterior. Una sesión
+    propia escribiría primero y la exterior pisaría después esos campos con sus valores
+    pendientes, que son más viejos.
+    """
+    anterior = getattr(_sesiones, 'actual', None)
+    if anterior is not None:
+        yield anterior
+        return
+    sesion = _sesiones.actual = SesionEscritura()
+    try:
+        with db.atomic():
+            yield sesion
+            _sesiones.actual = None
+            sesion.guardar()
+    finally:
+        _sesiones.actual = None
+        sesion.descartar()
 
-db = SqliteDatabase('obras_urbanas.db')
 
 class BaseModel(Model):
     class Meta:
         database = db
 
-class Etapa(BaseModel):
+    def save(self, force_insert=False, only=None):
+        # Dentro de sesion_escritura las actualizaciones de filas existentes se difieren;
+        # las inserciones se hacen en el momento porque hace falta el id
+        sesion = getattr(_sesiones, 'actual', None)
+        if sesion is not None and not force_insert and only is None and self._pk is not None:
+            return sesion.diferir(self)
+        return super().save(force_insert=force_insert, only=only)
+
+    @classmethod
+    def _registrar_escritura(cls, solo_altas=False):
+        registro_cambios.registrar(cls)
+
+    @classmethod
+    def insert(cls, *args, **kwargs):
+        cls._registrar_escritura(solo_altas=True)
+        return super().insert(*args, **kwargs)
+
+    @classmethod
+    def insert_many(cls, *args, **kwargs):
+        cls._registrar_escritura(solo_altas=True)
+        return super().insert_many(*args, **kwargs)
+
+    @classmethod
+    def insert_from(cls, *args, **kwargs):
+        cls._registrar_escritura(solo_altas=True)
+        return super().insert_from(*args, **kwargs)
+
+    @classmethod
+    def replace(cls, *args, **kwargs):
+        cls._registrar_escritura()
+        return super().replace(*args, **kwargs)
+
+    @classmethod
+    def replace_many(cls, *args, **kwargs):
+        cls._registrar_escritura()
+        return super().replace_many(*args, **kwargs)
+
+    @classmethod
+    def update(cls, *args, **kwargs):
+        cls._registrar_escritura()
+        return super().update(*args, **kwargs)
+
+    @classmethod
+    def delete(cls):
+        cls._registrar_escritura()
+        return super().delete()
+
+class ModeloDimension(BaseModel):
+    """
+    Tabla de búsqueda chica identificada por campo_clave. Toda escritura sobre la
+    tabla invalida sus entradas en cache_dimensiones; una inserción solo marca que la
+    caché ya no tiene la tabla completa.
+    """
+    campo_clave = 'nombre'
+
+    @classmethod
+    def _registrar_escritura(cls, solo_altas=False):
+        cache_dimensiones.invalidar(cls, solo_altas=solo_altas)
+        super()._registrar_escritura(solo_altas)
+
+class Etapa(ModeloDimension):
     nombre = CharField(unique=True, null=False)
 
-class TipoObra(BaseModel):
+class TipoObra(ModeloDimension):
     nombre = CharField(unique=True, null=False)
 
-class AreaResponsable(BaseModel):
+class AreaResponsable(ModeloDimension):
     nombre = CharField(unique=True, null=False)
 
-class Comuna(BaseModel):
+class Comuna(ModeloDimension):
+    campo_clave = 'numero'
     numero = IntegerField(unique=True, null=False)
 
 class Barrio(BaseModel):
     nombre = CharField(null=False)
     comuna = ForeignKeyField(Comuna, backref='barrios')
 
-class TipoContratacion(BaseModel):
+    class Meta:
+        # Un barrio es único dentro de su comuna; es la búsqueda que hace la carga de datos
+        indexes = (
+            (('nombre', 'comuna'), True),
+        )
+
+class TipoContratacion(ModeloDimension):
     nombre = CharField(unique=True, null=False)
 
-class Empresa(BaseModel):
+class Empresa(ModeloDimension):
     nombre = CharField(unique=True, null=False)
 
-class Financiamiento(BaseModel):
+class Financiamiento(ModeloDimension):
     nombre = CharField(unique=True, null=False)
 
 class Obra(BaseModel):
-    nombre = CharField(null=False)
+    nombre = CharField(null=False, index=True)
     descripcion = TextField(null=True)
     direccion = CharField(null=True)
+    lat = FloatField(null=True)
+    lng = FloatField(null=True)
     monto_contrato = FloatField(null=True)
     tipo_obra = ForeignKeyField(TipoObra, backref='obras', null=True)
     area_responsable = ForeignKeyField(AreaResponsable, backref='obras', null=True)
@@ -45,7 +449,7 @@ class Obra(BaseModel):
     porcentaje_avance = FloatField(null=True)
     fecha_inicio = DateField(null=True)
     fecha_fin_inicial = DateField(null=True)
-    plazo_meses = IntegerField(null=True)
+    plazo_meses = IntegerField(null=True, index=True)
     mano_obra = IntegerField(null=True)
     contratacion_tipo = ForeignKeyField(TipoContratacion, backref='obras', null=True)
     nro_contratacion = CharField(null=True)
@@ -56,64 +460,352 @@ class Obra(BaseModel):
 
     class Meta:
         db_table = 'obras'
+        # save() escribe solo los campos modificados: los pasos del ciclo de vida tocan uno o
+        # dos campos y no disparan los triggers de los índices si no cambian sus columnas
+        only_save_dirty = True
+        # Las claves foráneas ya tienen índice propio (peewee los crea por defecto).
+        # (etapa, plazo_meses) resuelve "obras de una etapa dentro de un plazo" sin leer la tabla.
+        indexes = (
+            (('etapa', 'plazo_meses'), False),
+        )
 
     # Métodos de instancia para el ciclo de vida
+    @instrumentado
     def nuevo_proyecto(self):
-        self.etapa, _ = Etapa.get_or_create(nombre="Proyecto")
+        self.etapa = cache_dimensiones.obtener(Etapa, "Proyecto")
         self.save()
-        print(f"Obra '{self.nombre}' iniciada como 'Proyecto'.")
+        reportes.info("Obra '%s' iniciada como 'Proyecto'.", self.nombre)
 
+    @instrumentado
     def iniciar_contratacion(self, nro_contratacion_val, tipo_contratacion_nombre):
-        self.etapa, _ = Etapa.get_or_create(nombre="Contratación")
+        self.etapa = cache_dimensiones.obtener(Etapa, "Contratación")
         self.nro_contratacion = nro_contratacion_val
-        self.contratacion_tipo, _ = TipoContratacion.get_or_create(nombre=tipo_contratacion_nombre)
+        self.contratacion_tipo = cache_dimensiones.obtener(TipoContratacion, tipo_contratacion_nombre)
         self.save()
-        print(f"Obra '{self.nombre}': Iniciada Contratación ({self.nro_contratacion}, {self.contratacion_tipo.nombre}).")
+        reportes.info("Obra '%s': Iniciada Contratación (%s, %s).", self.nombre, self.nro_contratacion, self.contratacion_tipo.nombre)
 
+    @instrumentado
     def adjudicar_obra(self, empresa_nombre, cuit_empresa, nro_expediente_val):
-        self.etapa, _ = Etapa.get_or_create(nombre="Adjudicada")
-        self.licitacion_oferta_empresa, _ = Empresa.get_or_create(nombre=empresa_nombre)
+        self.etapa = cache_dimensiones.obtener(Etapa, "Adjudicada")
+        self.licitacion_oferta_empresa = cache_dimensiones.obtener(Empresa, empresa_nombre)
         self.nro_expediente = nro_expediente_val
         self.save()
-        print(f"Obra '{self.nombre}': Adjudicada a {empresa_nombre} ({cuit_empresa}), Expediente: {nro_expediente_val}.")
+        reportes.info("Obra '%s': Adjudicada a %s (%s), Expediente: %s.", self.nombre, empresa_nombre, cuit_empresa, nro_expediente_val)
 
+    @instrumentado
     def iniciar_obra(self, fecha_inicio_val, fecha_fin_inicial_val, fuente_financiamiento_nombre, mano_obra_val):
-        self.etapa, _ = Etapa.get_or_create(nombre="En ejecución")
+        self.etapa = cache_dimensiones.obtener(Etapa, "En ejecución")
         self.fecha_inicio = fecha_inicio_val
         self.fecha_fin_inicial = fecha_fin_inicial_val
-        self.financiamiento, _ = Financiamiento.get_or_create(nombre=fuente_financiamiento_nombre)
+        self.financiamiento = cache_dimensiones.obtener(Financiamiento, fuente_financiamiento_nombre)
         self.mano_obra = mano_obra_val
         self.save()
-        print(f"Obra '{self.nombre}': Iniciada el {self.fecha_inicio}, Fin inicial: {self.fecha_fin_inicial}, Financiamiento: {self.financiamiento.nombre}, Mano de obra: {self.mano_obra}.")
+        reportes.info("Obra '%s': Iniciada el %s, Fin inicial: %s, Financiamiento: %s, Mano de obra: %s.",
+                      self.nombre, self.fecha_inicio, self.fecha_fin_inicial, self.financiamiento.nombre, self.mano_obra)
 
+    @instrumentado
     def actualizar_porcentaje_avance(self, nuevo_porcentaje):
         self.porcentaje_avance = nuevo_porcentaje
         self.save()
-        print(f"Obra '{self.nombre}': Porcentaje de avance actualizado a {self.porcentaje_avance}%.")
+        reportes.info("Obra '%s': Porcentaje de avance actualizado a %s%%.", self.nombre, self.porcentaje_avance)
 
+    @instrumentado
     def aumentar_plazo(self, meses_extra):
         if self.plazo_meses is None:
             self.plazo_meses = 0
         self.plazo_meses += meses_extra
         self.save()
-        print(f"Obra '{self.nombre}': Plazo incrementado en {meses_extra} meses (Total: {self.plazo_meses}).")
+        reportes.info("Obra '%s': Plazo incrementado en %s meses (Total: %s).", self.nombre, meses_extra, self.plazo_meses)
 
+    @instrumentado
     def incrementar_mano_obra(self, cantidad_extra):
         if self.mano_obra is None:
             self.mano_obra = 0
         self.mano_obra += cantidad_extra
         self.save()
-        print(f"Obra '{self.nombre}': Mano de obra incrementada en {cantidad_extra} (Total: {self.mano_obra}).")
+        reportes.info("Obra '%s': Mano de obra incrementada en %s (Total: %s).", self.nombre, cantidad_extra, self.mano_obra)
 
+    @instrumentado
     def finalizar_obra(self):
-        self.etapa, _ = Etapa.get_or_create(nombre="Finalizada")
+        self.etapa = cache_dimensiones.obtener(Etapa, "Finalizada")
         self.porcentaje_avance = 100
         self.save()
-        print(f"Obra '{self.nombre}': Finalizada.")
+        reportes.info("Obra '%s': Finalizada.", self.nombre)
 
+    @instrumentado
     def rescindir_obra(self):
-        self.etapa, _ = Etapa.get_or_create(nombre="Rescindida")
+        self.etapa = cache_dimensiones.obtener(Etapa, "Rescindida")
         self.save()
-        print(f"Obra '{self.nombre}': Rescindida.")
+        reportes.info("Obra '%s': Rescindida.", self.nombre)
+
+    @classmethod
+    def condicion_vigente(cls):
+        """
+        Condición para excluir las obras cuya fila del CSV ya no aparece (huella marcada como
+        removida por la sincronización con marcar_removidas). La usan indicadores y búsquedas.
+        """
+        removidas = (HuellaObra.select(HuellaObra.obra)
+                               .where((HuellaObra.removida == True) & HuellaObra.obra.is_null(False)))
+        return cls.id.not_in(removidas)
+
+    @classmethod
+    def en_rectangulo(cls, lat_min, lng_min, lat_max, lng_max):
+        """
+        SELECT de las obras con coordenadas dentro del rectángulo, resuelto con el índice
+        espacial (obras_rtree). El R*Tree guarda las coordenadas en precisión simple y
+        redondeadas hacia afuera, así que el filtro exacto se repite sobre lat y lng.
+        """
+        return (cls.select()
+                   .join(IndiceEspacial, on=(IndiceEspacial.id == cls.id))
+                   .where((IndiceEspacial.max_lat >= lat_min) & (IndiceEspacial.min_lat <= lat_max) &
+                          (IndiceEspacial.max_lng >= lng_min) & (IndiceEspacial.min_lng <= lng_max) &
+                          cls.lat.between(lat_min, lat_max) & cls.lng.between(lng_min, lng_max)))
+
+    @classmethod
+    def buscar_texto(cls, consulta_fts):
+        """
+        SELECT de las obras que coinciden con consulta_fts (sintaxis de FTS5) en nombre o
+        descripción, de la más a la menos relevante, con la relevancia (bm25 con signo
+        invertido: mayor es mejor) como atributo 'relevancia'.
+        """
+        return (cls.select(cls, (IndiceTexto.rank * -1).alias('relevancia'))
+                   .join(IndiceTexto, on=(IndiceTexto.rowid == cls.id))
+                   .where(Expression(IndiceTexto.obras_fts, 'MATCH', consulta_fts))
+                   .order_by(IndiceTexto.rank))
+
+    # Argumentos de cada operación del ciclo de vida: (nombre, tipos aceptados)
+    _ARGUMENTOS_TRANSICION = {
+        'nuevo_proyecto': (),
+        'iniciar_contratacion': (('nro_contratacion_val', (str, numbers.Integral, type(None))),
+                                 ('tipo_contratacion_nombre', str)),
+        'adjudicar_obra': (('empresa_nombre', str), ('cuit_empresa', (str, numbers.Integral, type(None))),
+                           ('nro_expediente_val', (str, numbers.Integral, type(None)))),
+        'iniciar_obra': (('fecha_inicio_val', date), ('fecha_fin_inicial_val', date),
+                         ('fuente_financiamiento_nombre', str), ('mano_obra_val', numbers.Integral)),
+        'actualizar_porcentaje_avance': (('nuevo_porcentaje', numbers.Real),),
+        'aumentar_plazo': (('meses_extra', numbers.Integral),),
+        'incrementar_mano_obra': (('cantidad_extra', numbers.Integral),),
+        'finalizar_obra': (),
+        'rescindir_obra': (),
+    }
+
+    @classmethod
+    def cambios_transicion(cls, operacion, *args):
+        """
+        Retorna las asignaciones campo -> valor/expresión que aplica la operación del ciclo
+        de vida indicada, con la misma semántica de etapas que los métodos de instancia.
+        Sirve para aplicar la transición con un UPDATE sobre muchas obras a la vez.
+        Lanza ValueError si la operación no existe o los argumentos no son del tipo esperado.
+        """
+        etapa = lambda nombre: cache_dimensiones.obtener_id(Etapa, nombre)
+        transiciones = {
+            'nuevo_proyecto': lambda: {cls.etapa: etapa("Proyecto")},
+            'iniciar_contratacion': lambda nro_contratacion_val, tipo_contratacion_nombre: {
+                cls.etapa: etapa("Contratación"),
+                cls.nro_contratacion: nro_contratacion_val,
+                cls.contratacion_tipo: cache_dimensiones.obtener_id(TipoContratacion, tipo_contratacion_nombre),
+            },
+            'adjudicar_obra': lambda empresa_nombre, cuit_empresa, nro_expediente_val: {
+                cls.etapa: etapa("Adjudicada"),
+                cls.licitacion_oferta_empresa: cache_dimensiones.obtener_id(Empresa, empresa_nombre),
+                cls.nro_expediente: nro_expediente_val,
+            },
+            'iniciar_obra': lambda fecha_inicio_val, fecha_fin_inicial_val, fuente_financiamiento_nombre, mano_obra_val: {
+                cls.etapa: etapa("En ejecución"),
+                cls.fecha_inicio: fecha_inicio_val,
+                cls.fecha_fin_inicial: fecha_fin_inicial_val,
+                cls.financiamiento: cache_dimensiones.obtener_id(Financiamiento, fuente_financiamiento_nombre),
+                cls.mano_obra: mano_obra_val,
+            },
+            'actualizar_porcentaje_avance': lambda nuevo_porcentaje: {cls.porcentaje_avance: nuevo_porcentaje},
+            'aumentar_plazo': lambda meses_extra: {cls.plazo_meses: fn.COALESCE(cls.plazo_meses, 0) + meses_extra},
+            'incrementar_mano_obra': lambda cantidad_extra: {cls.mano_obra: fn.COALESCE(cls.mano_obra, 0) + cantidad_extra},
+            'finalizar_obra': lambda: {cls.etapa: etapa("Finalizada"), cls.porcentaje_avance: 100},
+            'rescindir_obra': lambda: {cls.etapa: etapa("Rescindida")},
+        }
+        if not isinstance(operacion, str) or operacion not in transiciones:
+            raise ValueError(f"Operación desconocida: {operacion!r}")
+        esperados = cls._ARGUMENTOS_TRANSICION[operacion]
+        if len(args) != len(esperados):
+            raise ValueError(f"Argumentos inválidos para '{operacion}': {args}")
+        for valor, (nombre, tipos) in zip(args, esperados):
+            # bool es un entero para Python, pero no un número de meses ni un porcentaje
+            if isinstance(valor, bool) or not isinstance(valor, tipos):
+                raise ValueError(f"Argumento inválido para '{operacion}': {nombre}={valor!r}")
+        try:
+            return transiciones[operacion](*args)
+        except TypeError:
+            raise ValueError(f"Argumentos inválidos para '{operacion}': {args}") from None
+
+class HuellaObra(BaseModel):
+    # Huella de una fila del CSV de origen, usada por la sincronización incremental:
+    # clave estable de la fila, hash de su contenido y la obra que generó.
+    clave = BigIntegerField(unique=True, null=False)
+    hash_contenido = BigIntegerField(null=False)
+    obra = ForeignKeyField(Obra, backref='huellas', null=True, on_delete='SET NULL')
+    removida = BooleanField(default=False)
+
+    class Meta:
+        # Obra.condicion_vigente busca las obras removidas sin recorrer la tabla
+        indexes = (
+            (('removida', 'obra'), False),
+        )
+
+MODELOS = [Etapa, TipoObra, AreaResponsable, Comuna, Barrio, TipoContratacion, Empresa, Financiamiento, Obra, HuellaObra]
+
+# Índice espacial de las obras: un R*Tree con un rectángulo degenerado (un punto) por obra con
+# coordenadas, mantenido por triggers sobre la tabla obras.
+IndiceEspacial = Table('obras_rtree', ('id', 'min_lat', 'max_lat', 'min_lng', 'max_lng')).bind(db)
+
+SQL_INDICE_ESPACIAL = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS obras_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng)',
+    """CREATE TRIGGER IF NOT EXISTS obras_rtree_insert AFTER INSERT ON obras
+       WHEN new.lat IS NOT NULL AND new.lng IS NOT NULL BEGIN
+           INSERT INTO obras_rtree VALUES (new.id, new.lat, new.lat, new.lng, new.lng);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS obras_rtree_update AFTER UPDATE OF id, lat, lng ON obras BEGIN
+           DELETE FROM obras_rtree WHERE id = old.id;
+           INSERT INTO obras_rtree SELECT new.id, new.lat, new.lat, new.lng, new.lng
+               WHERE new.lat IS NOT NULL AND new.lng IS NOT NULL;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS obras_rtree_delete AFTER DELETE ON obras BEGIN
+           DELETE FROM obras_rtree WHERE id = old.id;
+       END""",
+]
+
+# Índice de texto completo sobre nombre y descripción. Es de contenido externo (el texto vive
+# solo en obras) y lo mantienen triggers. remove_diacritics 2 hace que "educacion" encuentre
+# "Educación"; el rango por defecto es bm25 con el nombre pesando más que la descripción.
+IndiceTexto = Table('obras_fts', ('rowid', 'nombre', 'descripcion', 'obras_fts', 'rank')).bind(db)
+
+PESOS_BM25 = (10.0, 1.0)  # nombre, descripcion
+
+SQL_INDICE_TEXTO = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS obras_fts USING fts5(
+           nombre, descripcion, content='obras', content_rowid='id',
+           tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS obras_fts_insert AFTER INSERT ON obras BEGIN
+           INSERT INTO obras_fts(rowid, nombre, descripcion) VALUES (new.id, new.nombre, new.descripcion);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS obras_fts_update AFTER UPDATE OF id, nombre, descripcion ON obras BEGIN
+           INSERT INTO obras_fts(obras_fts, rowid, nombre, descripcion)
+               VALUES ('delete', old.id, old.nombre, old.descripcion);
+           INSERT INTO obras_fts(rowid, nombre, descripcion) VALUES (new.id, new.nombre, new.descripcion);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS obras_fts_delete AFTER DELETE ON obras BEGIN
+           INSERT INTO obras_fts(obras_fts, rowid, nombre, descripcion)
+               VALUES ('delete', old.id, old.nombre, old.descripcion);
+       END""",
+]
+
+# Indexan en bloque las obras con id mayor al indicado (ver indexacion_diferida)
+SQL_INDEXAR_DESDE = [
+    'INSERT INTO obras_rtree SELECT id, lat, lat, lng, lng FROM obras '
+    'WHERE id > ? AND lat IS NOT NULL AND lng IS NOT NULL',
+    'INSERT INTO obras_fts(rowid, nombre, descripcion) SELECT id, nombre, descripcion FROM obras WHERE id > ?',
+]
+
+RADIO_TERRESTRE_METROS = 6371008.8
+
+
+def crear_esquema():
+    """
+    Crea las tablas que falten y completa el esquema con migrar_esquema. Si el esquema ya
+    está completo (esquema_actualizado) no ejecuta nada más: así los comandos de solo
+    lectura no pagan el DDL ni la importación de playhouse.migrate en cada arranque.
+    """
+    if esquema_actualizado():
+        return
+    db.create_tables(MODELOS)
+    migrar_esquema()
+
+
+def esquema_actualizado():
+    """
+    True si la base tiene todas las tablas e índices de MODELOS, los índices espacial y de
+    texto con sus triggers y las columnas lat y lng en obras. Son dos consultas al catálogo.
+    """
+    esperados = {Modelo._meta.table_name for Modelo in MODELOS} | {'obras_rtree', 'obras_fts'}
+    esperados.update(indice._name for Modelo in MODELOS for indice in Modelo._meta.fields_to_index())
+    esperados.update(re.findall(r'CREATE TRIGGER IF NOT EXISTS (\w+)', ' '.join(SQL_INDICE_ESPACIAL + SQL_INDICE_TEXTO)))
+    existentes = {nombre for nombre, in db.execute_sql('SELECT name FROM sqlite_master')}
+    if not esperados <= existentes:
+        return False
+    columnas = {columna.name for columna in db.get_columns(Obra._meta.table_name)}
+    return {'lat', 'lng'} <= columnas
+
+
+def migrar_esquema():
+    """
+    Completa el esquema después de create_tables: agrega a una tabla obras existente las
+    columnas que se sumaron al modelo (lat, lng) y crea los índices espacial y de texto con
+    sus triggers, llenándolos con las obras que ya existían. Es idempotente.
+    """
+    # playhouse.migrate se importa acá: es solo para migrar y demora el arranque de todo lo demás
+    from playhouse.migrate import SqliteMigrator, migrate
+
+    columnas = {columna.name for columna in db.get_columns(Obra._meta.table_name)}
+    migrador = SqliteMigrator(db)
+    operaciones = [migrador.add_column(Obra._meta.table_name, nombre, FloatField(null=True))
+                   for nombre in ('lat', 'lng') if nombre not in columnas]
+    tablas = db.get_tables()
+    with db.atomic():
+        if operaciones:
+            migrate(*operaciones)
+        for sql in SQL_INDICE_ESPACIAL + SQL_INDICE_TEXTO:
+            db.execute_sql(sql)
+        indice_espacial, indice_texto = SQL_INDEXAR_DESDE
+        if 'obras_rtree' not in tablas:
+            db.execute_sql(indice_espacial, (0,))
+        if 'obras_fts' not in tablas:
+            db.execute_sql("INSERT INTO obras_fts(obras_fts, rank) VALUES ('rank', ?)",
+                           ('bm25({}, {})'.format(*PESOS_BM25),))
+            db.execute_sql(indice_texto, (0,))
+
+
+@contextmanager
+def indexacion_diferida():
+    """
+    Para inserciones masivas de obras dentro de una transacción: quita los triggers de
+    inserción de los índices espacial y de texto y, al salir, indexa en dos sentencias las
+    obras nuevas (id mayor al máximo previo). Indexar en bloque es varias veces más rápido
+    que hacerlo fila por fila desde el trigger. Los triggers se vuelven a crear antes de
+    terminar la transacción, así que otras conexiones nunca los ven ausentes.
+    """
+    if not db.in_transaction():
+        raise RuntimeError("indexacion_diferida() requiere una transacción abierta")
+    desde = Obra.select(fn.MAX(Obra.id)).scalar() or 0
+    db.execute_sql('DROP TRIGGER IF EXISTS obras_rtree_insert')
+    db.execute_sql('DROP TRIGGER IF EXISTS obras_fts_insert')
+    try:
+        yield
+        for sql in SQL_INDEXAR_DESDE:
+            db.execute_sql(sql, (desde,))
+    finally:
+        for sql in SQL_INDICE_ESPACIAL + SQL_INDICE_TEXTO:
+            db.execute_sql(sql)
+
+
+def rectangulo_de_radio(lat, lng, radio_metros):
+    """
+    Rectángulo (lat_min, lng_min, lat_max, lng_max) que contiene el círculo de radio_metros
+    alrededor del punto. Si el círculo toca un polo o cruza el antimeridiano se usa todo el
+    rango de longitudes: el rectángulo solo tiene que ser un superconjunto.
+    """
+    delta_lat = math.degrees(radio_metros / RADIO_TERRESTRE_METROS)
+    lat_min, lat_max = max(lat - delta_lat, -90.0), min(lat + delta_lat, 90.0)
+    coseno = math.cos(math.radians(max(abs(lat_min), abs(lat_max))))
+    if lat_min <= -90 or lat_max >= 90 or coseno <= 0:
+        return lat_min, -180.0, lat_max, 180.0
+    delta_lng = math.degrees(radio_metros / (RADIO_TERRESTRE_METROS * coseno))
+    if lng - delta_lng < -180 or lng + delta_lng > 180:
+        return lat_min, -180.0, lat_max, 180.0
+    return lat_min, lng - delta_lng, lat_max, lng + delta_lng
+
 
-MODELOS = [Etapa, TipoObra, AreaResponsable, Comuna, Barrio, TipoContratacion, Empresa, Financiamiento, Obra]
\ No newline at end of file
+def distancia_metros(lat1, lng1, lat2, lng2):
+    # Distancia sobre la esfera (haversine)
+    fi1, fi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((fi2 - fi1) / 2) ** 2 +
+         math.cos(fi1) * math.cos(fi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * RADIO_TERRESTRE_METROS * math.asin(min(1.0, math.sqrt(a)))
\ No newline at end of file